@@ -43,12 +43,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'ProjectManagerApp.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'ProjectManagerApp.middleware.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ProjectManagerApp.middleware.HttpResponseNotAllowedMiddleware',
@@ -58,7 +60,7 @@ ROOT_URLCONF = 'ProjectManager.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'ProjectManagerApp.service.RequestTrace.DjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'ProjectManagerApp/templates'),
         ],
@@ -74,6 +76,7 @@ TEMPLATES = [
                 'ProjectManagerApp.context_processors.has_user_team',
                 'ProjectManagerApp.context_processors.teams_count',
                 'ProjectManagerApp.context_processors.projects_count',
+                'ProjectManagerApp.context_processors.user_team',
                 'ProjectManagerApp.context_processors.user_team_assigned_project',
                 'ProjectManagerApp.context_processors.user_team_applied_project',
                 'ProjectManagerApp.context_processors.max_field_length'
@@ -149,8 +152,97 @@ STATIC_URL = '/static/'
 
 LOGIN_URL = '/account/login/'
 
+# Number of rows shown on a single page of the projects and teams lists
+LIST_PAGE_SIZE = 50
+
+# Maximum number of projects a team can rank for the assignment by preferences
+PROJECT_PREFERENCES_MAX = 5
+
+# Cache configuration
+# Use a backend shared by all worker processes (e.g. memcached) in production, otherwise cached
+# counters are only invalidated in the process that changed the data.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds after which cached teams and projects counters are recounted
+COUNTER_CACHE_TIMEOUT = 300
+
+# Cache of authenticated users: None disables it, 'local' keeps up to USER_CACHE_SIZE users in each process
+# and 'shared' stores them in the default cache. A local cache is only invalidated in the process that changed
+# the user, other processes may serve it for up to USER_CACHE_TIMEOUT seconds.
+USER_CACHE = None
+USER_CACHE_SIZE = 1000
+USER_CACHE_TIMEOUT = 60
+
+# Request metrics served at /metrics/ to staff users. Every worker process writes its metrics to a file in
+# METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds and /metrics/ merges all files. Set METRICS_DIR to a
+# directory writable by the web server when running several processes (e.g. Apache with mod_wsgi), with None only
+# the metrics of the process serving /metrics/ are shown. Files of processes that exited are removed once they are
+# METRICS_STALE_AFTER seconds old, their requests then drop out of the totals like after a restart.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+METRICS_STALE_AFTER = 3600
+
+# Adds a Server-Timing header with the time spent in authentication, context processors, SQL, templates and the
+# handler (the view with its templates and the response middleware) to responses of the application views, shown by
+# the browser developer tools
+SERVER_TIMING = False
+
+# Staff users can profile a request by adding ?profile=<sort key> or the X-Profile header to any URL. The profile
+# is written to PROFILE_DIR as a .prof file (for pstats or snakeviz) and a .txt summary of the top
+# PROFILE_SUMMARY_LIMIT functions. None disables profiling.
+PROFILE_DIR = None
+PROFILE_SUMMARY_LIMIT = 50
+
+# Queries running at least SLOW_QUERY_THRESHOLD seconds are logged with their caller and EXPLAIN plan to
+# SLOW_QUERY_LOG_FILE and kept in memory, the last SLOW_QUERY_BUFFER_SIZE per process are shown to superusers at
+# /metrics/slowQueries/. None disables the slow query log. Bound params are replaced by their types unless
+# SLOW_QUERY_LOG_PARAMS is set, as they can contain password hashes and emails.
+SLOW_QUERY_THRESHOLD = 0.5
+SLOW_QUERY_BUFFER_SIZE = 100
+SLOW_QUERY_LOG_PARAMS = False
+SLOW_QUERY_LOG_FILE = os.path.join(BASE_DIR, 'slow_queries.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries_file': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'ProjectManagerApp.slow_queries': {
+            'handlers': ['slow_queries_file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Every request and every call of a services.py function is traced as a span with its duration, query count,
+# written rows and raised exception. Spans of service calls nest under the span of their request and are appended
+# to SERVICE_TRACE_FILE as JSON lines. None disables the export.
+SERVICE_TRACE_FILE = None
+
+# Sessions configuration
+# Sessions are written only on login, logout and password change. With a cache shared by all worker processes
+# 'django.contrib.sessions.backends.cached_db' also stops reading them from the database on every request, and
+# 'django.contrib.sessions.backends.signed_cookies' keeps them out of the database entirely.
+# Compare the options with: python3 manage.py benchmark_session_writes
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
 # Messages configuration
-MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+# Messages are kept in a cookie, so a redirect after POST doesn't write the session to pass them. The session is
+# used only for messages too large for the cookie.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
 
 # Close the session when user closes the browser
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ProjectmanagerappConfig(AppConfig):
     name = 'ProjectManagerApp'
+
+    def ready(self):
+        from ProjectManagerApp import signals  # noqa
@@ -1,46 +1,75 @@
-from ProjectManagerApp.models import Student, Teacher, Team, Project
+from collections import Counter
+from functools import wraps
 
+from django.utils.functional import SimpleLazyObject
 
+from ProjectManagerApp.service.CounterCache import get_teams_count, get_projects_count
+from ProjectManagerApp.service.RequestTrace import traced
+from ProjectManagerApp.service.UserState import get_user_state
+
+
+def lazy(processor):
+    @wraps(processor)
+    def wrapper(request):
+        def evaluate():
+            get_evaluated_context_processors(request)[processor.__name__] += 1
+            return processor(request)[processor.__name__]
+
+        return {processor.__name__: SimpleLazyObject(evaluate)}
+    return wrapper
+
+
+def get_evaluated_context_processors(request):
+    if not hasattr(request, '_evaluated_context_processors'):
+        request._evaluated_context_processors = Counter()
+    return request._evaluated_context_processors
+
+
+@traced('context_processors')
 def is_student(request):
-    return {'is_student': isinstance(request.user, Student)}
+    return {'is_student': get_user_state(request).is_student}
 
 
+@traced('context_processors')
 def is_teacher(request):
-    return {'is_teacher': isinstance(request.user, Teacher)}
+    return {'is_teacher': get_user_state(request).is_teacher}
 
 
+@traced('context_processors')
 def has_user_team(request):
-    return {'has_user_team': isinstance(request.user, Student) and request.user.team is not None}
-
+    return {'has_user_team': get_user_state(request).has_user_team}
 
-def user_team_assigned_project(request):
-    if not isinstance(request.user, Student) or not request.user.team:
-        return {'user_team_assigned_project': False}
 
-    all_projects = Project.objects.filter(assigned_team__pk__exact=request.user.team.pk).all()
-    if all_projects.count():
-        return {'user_team_assigned_project': all_projects[0]}
-    return {'user_team_assigned_project': False}
+@lazy
+@traced('context_processors')
+def user_team(request):
+    return {'user_team': get_user_state(request).team}
 
 
-def user_team_applied_project(request):
-    if not isinstance(request.user, Student) or not request.user.team:
-        return {'user_team_applied_project': False}
+@lazy
+@traced('context_processors')
+def user_team_assigned_project(request):
+    return {'user_team_assigned_project': get_user_state(request).assigned_project}
 
-    for project in Project.objects.all():
-        if request.user.team and project.all_teams.filter(name=request.user.team.name):
-            return {'user_team_applied_project': project}
 
-    return {'user_team_applied_project': False}
+@lazy
+@traced('context_processors')
+def user_team_applied_project(request):
+    return {'user_team_applied_project': get_user_state(request).applied_project}
 
 
+@lazy
+@traced('context_processors')
 def teams_count(request):
-    return {'teams_count': Team.objects.all().count()}
+    return {'teams_count': get_teams_count()}
 
 
+@lazy
+@traced('context_processors')
 def projects_count(request):
-    return {'projects_count': Project.objects.all().count()}
+    return {'projects_count': get_projects_count()}
 
 
+@traced('context_processors')
 def max_field_length(request):
     return {'max_field_length': 15}
@@ -60,3 +60,11 @@ class TeamIsFull(Exception):
 
 class UserAssignedToProject(Exception):
     pass
+
+
+class TooManyProjectPreferences(Exception):
+    pass
+
+
+class DuplicateProjectPreference(Exception):
+    pass
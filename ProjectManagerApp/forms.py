@@ -74,3 +74,26 @@ class ProjectEditForm(ProjectCreateForm):
 
 class TeamCreateForm(forms.Form):
     name = forms.CharField(label='Team name', max_length=50)
+
+
+class ProjectPreferencesForm(forms.Form):
+    def __init__(self, projects, preferences_max, *args, **kwargs):
+        super(ProjectPreferencesForm, self).__init__(*args, **kwargs)
+        for rank in range(1, preferences_max + 1):
+            self.fields['rank_' + repr(rank)] = forms.ModelChoiceField(label='Choice ' + repr(rank),
+                                                                       queryset=projects, required=False)
+
+    def clean(self):
+        selected = set()
+        for name in self.fields:
+            project = self.cleaned_data.get(name)
+            if project is None:
+                continue
+            if project.pk in selected:
+                self.add_error(name, "Project already chosen.")
+            selected.add(project.pk)
+
+        return self.cleaned_data
+
+    def get_projects(self):
+        return [self.cleaned_data[name] for name in self.fields if self.cleaned_data.get(name) is not None]
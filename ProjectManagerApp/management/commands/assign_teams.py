@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ProjectManagerApp.models import Project, Team
+from ProjectManagerApp.service.TeamAssignment import run_assignment, ASSIGNMENT_MODES, ASSIGNMENT_MODE_LOTTERY
+
+
+class Command(BaseCommand):
+    help = 'Assigns teams to projects, or with --dry-run computes the assignment without writing it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=ASSIGNMENT_MODES, default=ASSIGNMENT_MODE_LOTTERY)
+        parser.add_argument('--seed', type=int, help='Seed of the lottery, use it to replay a previewed draw.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Compute the assignment in memory without writing it.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            result = run_assignment(options['mode'], options['seed'], options['dry_run'])
+
+        self.stdout.write('Mode: ' + result.mode)
+        if result.seed is not None:
+            self.stdout.write('Seed: ' + repr(result.seed))
+        self.stdout.write(('Projects to assign: ' if result.dry_run else 'Projects assigned: ') +
+                          repr(result.projects_assigned))
+        for rank, count in sorted(result.rank_distribution.items()):
+            self.stdout.write('Teams with preference rank ' + repr(rank) + ': ' + repr(count))
+        self.stdout.write('Load time: %.3f s' % result.load_time)
+        self.stdout.write('Solve time: %.3f s' % result.solve_time)
+        self.stdout.write('Write time: ' + ('not run (dry run)' if result.dry_run else '%.3f s' % result.write_time))
+
+        if options['verbosity'] > 1:
+            projects = Project.objects.only('name').in_bulk(list(result.assignments))
+            teams = Team.objects.only('name').in_bulk([team[0] for team in result.assignments.values()])
+            for project_id, team in sorted(result.assignments.items()):
+                self.stdout.write(projects[project_id].name + ': ' + teams[team[0]].name)
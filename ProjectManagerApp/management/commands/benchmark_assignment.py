@@ -0,0 +1,126 @@
+import math
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ProjectManagerApp.models import Project
+from ProjectManagerApp.service.SyntheticData import seed_cohort
+from ProjectManagerApp.service.TeamAssignment import run_assignment, ASSIGNMENT_MODES, ASSIGNMENT_MODE_LOTTERY
+from ProjectManagerApp.services import assign_team_to_project
+
+PHASES = ('load', 'select', 'write', 'queries', 'single')
+
+
+class Command(BaseCommand):
+    help = 'Runs the team assignment on synthetic cohorts of growing size and prints the time of each phase with ' \
+           'its empirical complexity exponent. Nothing is stored, all changes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', default='100,1000,10000,50000',
+                            help='Comma separated numbers of projects.')
+        parser.add_argument('--queue-depths', default='5', dest='queue_depths',
+                            help='Comma separated mean numbers of teams queued for a project. A team waits in one '
+                                 'queue at most, so queues are shorter when there are fewer teams per project.')
+        parser.add_argument('--fill-ratios', default='5', dest='fill_ratios',
+                            help='Comma separated numbers of full teams per project.')
+        parser.add_argument('--mode', choices=ASSIGNMENT_MODES, default=ASSIGNMENT_MODE_LOTTERY)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each size, the fastest one is kept.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic cohorts and the lottery.')
+        parser.add_argument('--max-exponent', type=float, dest='max_exponent',
+                            help='Fail when the time of a phase grows faster than projects to this power.')
+        parser.add_argument('--max-query-exponent', type=float, dest='max_query_exponent',
+                            help='Fail when the number of queries grows faster than projects to this power, '
+                                 'e.g. 0.9 catches queries run per team.')
+
+    def handle(self, *args, **options):
+        project_counts = self.parse_list(options, 'projects', int)
+        queue_depths = self.parse_list(options, 'queue_depths', int)
+        fill_ratios = self.parse_list(options, 'fill_ratios', float)
+        if len(project_counts) < 2:
+            raise CommandError('At least two numbers of projects are needed to fit an exponent.')
+        if options['repeat'] < 1:
+            raise CommandError('Repeat must be positive.')
+
+        failures = []
+        for queue_depth in queue_depths:
+            for fill_ratio in fill_ratios:
+                self.stdout.write('Mode %s, queue depth %d, %.2f teams per project'
+                                  % (options['mode'], queue_depth, fill_ratio))
+                self.stdout.write('%10s %10s %10s %10s %10s %10s %10s %10s'
+                                  % ('projects', 'teams', 'queued', 'load ms', 'select ms', 'write ms', 'queries',
+                                     'single ms'))
+
+                rows = []
+                for projects in project_counts:
+                    rows.append(self.measure(projects, queue_depth, fill_ratio, options))
+                    self.stdout.write('%10d %10d %10d %10.1f %10.1f %10.1f %10d %10.2f' % rows[-1])
+
+                exponents = [fit_exponent(project_counts, [row[3 + i] for row in rows]) for i in range(len(PHASES))]
+                self.stdout.write('%32s %10.2f %10.2f %10.2f %10.2f %10.2f' % (('exponent',) + tuple(exponents)))
+                self.stdout.write('')
+
+                for phase, exponent in zip(PHASES, exponents):
+                    limit = options['max_query_exponent'] if phase == 'queries' else options['max_exponent']
+                    if limit is not None and exponent > limit:
+                        failures.append('%s with queue depth %d and %.2f teams per project: %.2f > %.2f'
+                                        % (phase, queue_depth, fill_ratio, exponent, limit))
+
+        if failures:
+            raise CommandError('Complexity exponents over the limit:\n' + '\n'.join(failures))
+
+    @staticmethod
+    def parse_list(options, name, convert):
+        try:
+            values = [convert(value) for value in options[name].split(',')]
+        except ValueError:
+            raise CommandError('--' + name.replace('_', '-') + ' must be comma separated numbers.')
+        if any(value <= 0 for value in values):
+            raise CommandError('--' + name.replace('_', '-') + ' must be positive.')
+        return values
+
+    def measure(self, projects, queue_depth, fill_ratio, options):
+        teams = max(int(projects * fill_ratio), 1)
+        timings = []
+        with transaction.atomic():
+            cohort = seed_cohort('benchmark_' + uuid.uuid4().hex[:8], 2 * teams, teams, projects,
+                                 max(projects // 100, 1), queue_depth, random.Random(options['seed']),
+                                 uuid.uuid4().hex)
+            queued = sum(len(queue) for queue in cohort.queued_teams.values())
+            project = Project.objects.get(pk=max(cohort.queued_teams, key=lambda pk: len(cohort.queued_teams[pk])))
+
+            for _ in range(options['repeat']):
+                # With DEBUG the log may be full of the seeding queries, and a full log captures nothing.
+                reset_queries()
+                with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    result = run_assignment(options['mode'], options['seed'])
+                    transaction.set_rollback(True)
+
+                # A single project is assigned when its queue is closed, its cost must not depend on the others.
+                with transaction.atomic():
+                    start = time.perf_counter()
+                    assign_team_to_project(project)
+                    single_time = time.perf_counter() - start
+                    transaction.set_rollback(True)
+
+                timings.append((result.load_time, result.solve_time, result.write_time, len(queries), single_time))
+            transaction.set_rollback(True)
+
+        load_time, solve_time, write_time, queries, single_time = (min(values) for values in zip(*timings))
+        return (projects, teams, queued, load_time * 1000, solve_time * 1000, write_time * 1000, queries,
+                single_time * 1000)
+
+
+def fit_exponent(sizes, values):
+    # Least squares slope of log(value) over log(size), values of 0 are clamped so that the logarithm exists.
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in values]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
@@ -0,0 +1,126 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ProjectManagerApp.models import Team, Teacher, Student
+from ProjectManagerApp.services import user_create_project
+
+CONFIGURATIONS = (
+    ('db sessions, session messages', 'django.contrib.sessions.backends.db',
+     'django.contrib.messages.storage.session.SessionStorage'),
+    ('db sessions, cookie messages', 'django.contrib.sessions.backends.db',
+     'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('cached_db sessions, cookie messages', 'django.contrib.sessions.backends.cached_db',
+     'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('signed_cookies sessions, cookie messages', 'django.contrib.sessions.backends.signed_cookies',
+     'django.contrib.messages.storage.fallback.FallbackStorage'),
+)
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = 'Counts database writes per request of the team and project flows for each sessions and messages ' \
+           'storage. Nothing is stored, all changes are rolled back.'
+
+    def handle(self, *args, **options):
+        results = []
+        for name, session_engine, message_storage in CONFIGURATIONS:
+            with override_settings(SESSION_ENGINE=session_engine, MESSAGE_STORAGE=message_storage,
+                                   ALLOWED_HOSTS=['testserver']):
+                with transaction.atomic():
+                    results.append((name, self.run_flows()))
+                    transaction.set_rollback(True)
+
+        for name, flows in results:
+            self.stdout.write(name)
+            totals = [0, 0, 0, 0]
+            for flow in flows:
+                self.write_flow(*flow)
+                totals = [total + value for total, value in zip(totals, flow[1:])]
+            self.write_flow('total', *totals)
+
+    def write_flow(self, name, requests, writes, session_writes, session_reads):
+        self.stdout.write('  %-16s requests: %2d  writes: %3d  session writes: %2d  session reads: %2d  '
+                          'writes per request: %.2f' % (name, requests, writes, session_writes, session_reads,
+                                                        writes / requests))
+
+    def run_flows(self):
+        suffix = uuid.uuid4().hex[:8]
+        password = uuid.uuid4().hex
+        student_no = (Student.objects.aggregate(Max('student_no'))['student_no__max'] or 0) + 1
+        teacher = self.create_user(Teacher(username='benchmark_teacher_' + suffix), password)
+        first_student = self.create_user(Student(username='benchmark_student1_' + suffix, student_no=student_no,
+                                                 status=Student.STUDENT_STATUS_UNASSIGNED), password)
+        second_student = self.create_user(Student(username='benchmark_student2_' + suffix, student_no=student_no + 1,
+                                                  status=Student.STUDENT_STATUS_UNASSIGNED), password)
+        project = user_create_project(teacher, 'benchmark_project_' + suffix, 'Benchmark project')
+
+        teacher_client = self.login(teacher, password)
+        first_client = self.login(first_student, password)
+        second_client = self.login(second_student, password)
+
+        flows = [
+            self.run_flow('create team', [
+                (first_client, 'get', reverse('team_create_url'), None),
+                (first_client, 'post', reverse('team_create_url'), {'name': 'benchmark_team_' + suffix}),
+            ]),
+        ]
+        team = Team.objects.get(name='benchmark_team_' + suffix)
+        flows += [
+            self.run_flow('join team', [
+                (second_client, 'post', reverse('team_join_url'), {'team_id': team.pk}),
+            ]),
+            self.run_flow('join project', [
+                (first_client, 'post', reverse('project_join_url'), {'project_id': project.pk}),
+            ]),
+            self.run_flow('leave project', [
+                (first_client, 'post', reverse('project_leave_url'), {'project_id': project.pk}),
+            ]),
+            self.run_flow('leave team', [
+                (second_client, 'post', reverse('team_leave_url'), None),
+            ]),
+            self.run_flow('create project', [
+                (teacher_client, 'get', reverse('project_create_url'), None),
+                (teacher_client, 'post', reverse('project_create_url'),
+                 {'name': 'benchmark_project2_' + suffix, 'description': 'Benchmark project'}),
+            ]),
+        ]
+        return flows
+
+    @staticmethod
+    def create_user(user, password):
+        user.set_password(password)
+        user.save()
+        return user
+
+    @staticmethod
+    def login(user, password):
+        client = Client()
+        client.login(username=user.username, password=password)
+        return client
+
+    @staticmethod
+    def run_flow(name, steps):
+        requests = writes = session_writes = session_reads = 0
+        for client, method, url, data in steps:
+            with CaptureQueriesContext(connection) as queries:
+                # Redirects after POST are followed, the page showing the message consumes it.
+                response = getattr(client, method)(url, data, follow=True)
+            requests += 1 + len(response.redirect_chain)
+
+            for query in queries.captured_queries:
+                sql = query['sql'].lstrip()
+                if sql.upper().startswith(WRITE_STATEMENTS):
+                    writes += 1
+                    if '"django_session"' in sql:
+                        session_writes += 1
+                elif '"django_session"' in sql:
+                    session_reads += 1
+
+        return name, requests, writes, session_writes, session_reads
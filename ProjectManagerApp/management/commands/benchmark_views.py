@@ -0,0 +1,190 @@
+import json
+import math
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ProjectManagerApp.models import Student, Teacher, Project
+from ProjectManagerApp.service.SyntheticData import seed_cohort
+from ProjectManagerApp.services import assign_teams_to_projects
+from ProjectManagerApp.urls import urlpatterns
+
+ROLES = ('student', 'teacher')
+
+
+class Command(BaseCommand):
+    help = 'Times every view and the team assignment on synthetic cohorts of several sizes and writes the results ' \
+           'as JSON. Nothing is stored, all changes are rolled back. Peak memory counts Python allocations only.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000',
+                            help='Comma separated numbers of students, with half as many teams and a tenth as many '
+                                 'projects.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs of each view.')
+        parser.add_argument('--output', help='File to write the results to, instead of the standard output.')
+        parser.add_argument('--baseline', help='Results of an earlier run to compare with.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Relative p95 latency increase over the baseline reported as a regression.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic cohorts.')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError('Scales must be comma separated numbers.')
+        if any(scale < 10 for scale in scales):
+            raise CommandError('Scales must have at least 10 students.')
+        if options['repeat'] < 1:
+            raise CommandError('Repeat must be positive.')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as exc:
+                raise CommandError('Cannot read the baseline: ' + str(exc))
+
+        results = []
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for scale in scales:
+                with transaction.atomic():
+                    results += self.run_scale(scale, options['repeat'], random.Random(options['seed']))
+                    transaction.set_rollback(True)
+
+        report = json.dumps({'scales': scales, 'repeat': options['repeat'], 'results': results}, indent=2,
+                            sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if baseline is not None:
+            regressions = self.compare(baseline['results'], results, options['tolerance'])
+            if regressions:
+                raise CommandError(repr(regressions) + ' benchmarks regressed.')
+
+    def run_scale(self, scale, repeat, rng):
+        self.stderr.write('Seeding ' + repr(scale) + ' students...')
+        cohort = seed_cohort('benchmark_' + uuid.uuid4().hex[:8], scale, scale // 2, max(scale // 10, 2),
+                             max(scale // 1000, 1), 5, rng, uuid.uuid4().hex)
+
+        # The student's team is queued for a project, the teacher is staff and the author of that project.
+        project_id, team_ids = next((project_id, teams) for project_id, teams in sorted(cohort.queued_teams.items())
+                                    if teams)
+        student = Student.objects.filter(team_id=team_ids[0]).order_by('pk')[0]
+        project = Project.objects.get(pk=project_id)
+        other_project = Project.objects.exclude(pk=project_id).order_by('pk')[0]
+        teacher = Teacher.objects.get(pk=project.author_id)
+        teacher.is_staff = True
+        teacher.save()
+
+        results = []
+        for role, user in zip(ROLES, (student, teacher)):
+            client = Client()
+            for name, method, url, data in get_requests(student.team_id, project, other_project):
+                self.stderr.write('  %s as %s' % (name, role))
+                # Logging in before every run undoes a logout, it is not timed.
+                results.append(self.measure(scale, name, role, repeat,
+                                            lambda: getattr(client, method)(url, data),
+                                            lambda: client.force_login(user)))
+
+        self.stderr.write('  assign_teams_to_projects')
+        results.append(self.measure(scale, 'assign_teams_to_projects', 'teacher', repeat,
+                                    lambda: assign_teams_to_projects(teacher)))
+        return results
+
+    @staticmethod
+    def measure(scale, name, role, repeat, run, prepare=lambda: None):
+        # The first run counts queries and memory, which slows it down, the other runs are timed.
+        prepare()
+        # With DEBUG the log may be full of the seeding queries, and a full log captures nothing.
+        reset_queries()
+        tracemalloc.start()
+        try:
+            with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                run()
+                transaction.set_rollback(True)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        durations = []
+        for _ in range(repeat):
+            prepare()
+            with transaction.atomic():
+                start = time.perf_counter()
+                run()
+                durations.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+
+        durations.sort()
+        return {
+            'scale': scale,
+            'name': name,
+            'role': role,
+            'p50_ms': round(percentile(durations, 50) * 1000, 3),
+            'p95_ms': round(percentile(durations, 95) * 1000, 3),
+            'queries': len(queries),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    def compare(self, baseline, results, tolerance):
+        previous = {(result['scale'], result['name'], result['role']): result for result in baseline}
+        regressions = 0
+        for result in results:
+            before = previous.get((result['scale'], result['name'], result['role']))
+            if before is None:
+                continue
+
+            changes = []
+            if result['queries'] > before['queries']:
+                changes.append('queries %d -> %d' % (before['queries'], result['queries']))
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                changes.append('p95 %.1f ms -> %.1f ms' % (before['p95_ms'], result['p95_ms']))
+            if changes:
+                regressions += 1
+                self.stderr.write('Regression of %s as %s with %d students: %s'
+                                  % (result['name'], result['role'], result['scale'], ', '.join(changes)))
+        return regressions
+
+
+def get_requests(team_id, project, other_project):
+    requests = {
+        'account_delete_url': ('post', {}, {}),
+        'project_join_url': ('post', {}, {'project_id': other_project.pk}),
+        'project_leave_url': ('post', {}, {'project_id': project.pk}),
+        'project_delete_url': ('post', {}, {'project_id': other_project.pk}),
+        'project_details_url': ('get', {'id': project.pk}, None),
+        'project_edit_url': ('get', {'id': project.pk}, None),
+        'team_assign_url': ('post', {}, {}),
+        'team_join_url': ('post', {}, {'team_id': team_id}),
+        'team_leave_url': ('post', {}, {}),
+        'team_details_url': ('get', {'id': team_id}, None),
+    }
+
+    urls = []
+    names = set()
+    for pattern in urlpatterns:
+        if pattern.name in names:
+            continue
+        names.add(pattern.name)
+        if pattern.name == 'error_404_url':
+            urls.append((pattern.name, 'get', '/missing/', None))
+        else:
+            method, kwargs, data = requests.get(pattern.name, ('get', {}, None))
+            urls.append((pattern.name, method, reverse(pattern.name, kwargs=kwargs), data))
+    return urls
+
+
+def percentile(values, percent):
+    # Nearest rank of sorted values.
+    return values[max(int(math.ceil(percent / 100 * len(values))) - 1, 0)]
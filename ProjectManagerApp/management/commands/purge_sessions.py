@@ -0,0 +1,48 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired sessions in small batches, unlike clearsessions which deletes them in one statement.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, dest='batch_size',
+                            help='Number of sessions deleted by a single statement.')
+        parser.add_argument('--sleep', type=float, default=0.5,
+                            help='Seconds to wait between batches, so that logins are not stalled.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Batch size must be positive.')
+
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(session_store, 'get_model_class'):
+            raise CommandError('Sessions engine ' + settings.SESSION_ENGINE + ' does not store sessions in the database.')
+        sessions = session_store.get_model_class().objects
+
+        # Sessions expiring while the command runs are left for the next run, so that the loop always ends.
+        now = timezone.now()
+        start = time.perf_counter()
+        deleted = 0
+        while True:
+            keys = list(sessions.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+            if not keys:
+                break
+
+            # A concurrent purge or logout may have deleted some of the selected sessions already.
+            deleted += sessions.filter(session_key__in=keys).delete()[0]
+
+            elapsed = time.perf_counter() - start
+            self.stdout.write('Deleted %d expired sessions in %.1f s (%.0f sessions/s)'
+                              % (deleted, elapsed, deleted / elapsed))
+
+            if len(keys) < batch_size:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write('Done. Deleted %d expired sessions in %.1f s.' % (deleted, time.perf_counter() - start))
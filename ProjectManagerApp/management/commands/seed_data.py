@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ProjectManagerApp.service.SyntheticData import seed_cohort
+
+
+class Command(BaseCommand):
+    help = 'Bulk inserts a synthetic cohort of teachers, students, teams, projects, project queues and preferences.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50000)
+        parser.add_argument('--teams', type=int, default=25000,
+                            help='Number of teams, filled with two students each while there are students left.')
+        parser.add_argument('--projects', type=int, default=5000)
+        parser.add_argument('--teachers', type=int, default=50)
+        parser.add_argument('--queue-length', type=int, default=5, dest='queue_length',
+                            help='Mean number of teams queued for a project.')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the user names, team and project names.')
+        parser.add_argument('--password', default='password', help='Password of every created user.')
+        parser.add_argument('--seed', type=int, help='Seed of the random queues, use it to recreate a cohort.')
+
+    def handle(self, *args, **options):
+        for option in ('students', 'teams', 'projects', 'queue_length'):
+            if options[option] < 0:
+                raise CommandError('--' + option.replace('_', '-') + ' cannot be negative.')
+        if options['teachers'] < 1 and options['projects']:
+            raise CommandError('Projects need at least one teacher.')
+
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix + '_').exists():
+            raise CommandError('Users prefixed with ' + prefix + '_ already exist, choose another --prefix.')
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            cohort = seed_cohort(prefix, options['students'], options['teams'], options['projects'],
+                                 options['teachers'], options['queue_length'], random.Random(options['seed']),
+                                 options['password'])
+
+        self.stdout.write('Teachers: ' + repr(len(cohort.teacher_ids)))
+        self.stdout.write('Students: ' + repr(len(cohort.student_ids)))
+        self.stdout.write('Teams: ' + repr(len(cohort.team_ids)))
+        self.stdout.write('Projects: ' + repr(len(cohort.project_ids)))
+        self.stdout.write('Queued teams: ' + repr(sum(len(teams) for teams in cohort.queued_teams.values())))
+        self.stdout.write('Project preferences: ' + repr(sum(len(projects)
+                                                             for projects in cohort.preferences.values())))
+        self.stdout.write('Done in %.1f s. Log in as %s_student_0 or %s_teacher_0.'
+                          % (time.perf_counter() - start, prefix, prefix))
@@ -0,0 +1,268 @@
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.core.urlresolvers import reverse
+from django.db import connection, DatabaseError
+from django.dispatch import receiver
+from django.test import Client, override_settings
+
+from ProjectManagerApp.management.commands.benchmark_views import percentile
+from ProjectManagerApp.models import Student, Team, Project
+from ProjectManagerApp.service.SyntheticData import seed_cohort
+from ProjectManagerApp.services import user_create_team
+
+OPERATIONS = ('team_join', 'team_leave', 'project_join', 'project_leave')
+
+DEADLOCK_DETECTED = '40P01'
+LOCK_NOT_AVAILABLE = '55P03'
+
+_local = threading.local()
+
+
+@receiver(got_request_exception)
+def record_request_exception(sender, request, **kwargs):
+    # Only the stress clients read it, from the thread that ran the request.
+    _local.exception = sys.exc_info()[1]
+
+
+class StressClient(Client):
+    def request(self, **request):
+        # The test client reraises the exceptions of requests of any thread, the handler turns them into error
+        # responses instead and the exception is kept for the thread that ran the request.
+        _local.exception = None
+        try:
+            return self.handler(self._base_environ(**request)), _local.exception
+        finally:
+            _local.exception = None
+
+
+class Command(BaseCommand):
+    help = 'Runs concurrent team and project join and leave requests of many students against a few teams, reports ' \
+           'throughput, lock waits and deadlocks, then checks that teams and students are consistent. Meant for ' \
+           'PostgreSQL, lock waits and deadlocks are not reported for other databases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--teams', type=int, default=10, help='Teams created before the run, students compete '
+                                                                  'for their free slots.')
+        parser.add_argument('--projects', type=int, default=10)
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--operations', type=int, default=20, help='Requests sent by each thread.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the created users, teams and projects.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['operations'] < 1:
+            raise CommandError('Threads and operations must be positive.')
+        if not 0 < options['teams'] <= options['students'] or options['projects'] < 1:
+            raise CommandError('There must be at least one team and one project, and no more teams than students.')
+
+        prefix = 'stress_' + uuid.uuid4().hex[:8]
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            clients, team_ids, project_ids = self.set_up(prefix, options)
+            try:
+                results, elapsed, lock_waits, deadlocks = self.run_threads(clients, team_ids, project_ids, options)
+                self.report(results, elapsed, lock_waits, deadlocks)
+                violations = check_invariants(prefix)
+            finally:
+                if not options['keep']:
+                    self.tear_down(prefix, clients)
+
+        if violations:
+            raise CommandError('Invariants violated:\n' + '\n'.join(violations))
+        self.stdout.write('Invariants: OK')
+
+    def set_up(self, prefix, options):
+        rng = random.Random(options['seed'])
+        cohort = seed_cohort(prefix, options['students'], 0, options['projects'], 1, 0, rng, uuid.uuid4().hex)
+
+        students = list(Student.objects.filter(pk__in=cohort.student_ids).order_by('pk'))
+        team_ids = [user_create_team(student, prefix + '_team_' + repr(i)).pk
+                    for i, student in enumerate(students[:options['teams']])]
+
+        clients = []
+        for student in students:
+            client = StressClient()
+            client.force_login(student)
+            clients.append(client)
+        return clients, team_ids, cohort.project_ids
+
+    def run_threads(self, clients, team_ids, project_ids, options):
+        threads_count = options['threads']
+        start_barrier = threading.Barrier(threads_count + 1)
+        results = [[] for _ in range(threads_count)]
+        # Each thread sends the requests of its own students, like students clicking at the same time.
+        threads = [threading.Thread(target=run_worker,
+                                    args=(clients[i::threads_count] or [clients[i % len(clients)]], team_ids,
+                                          project_ids, options['operations'], random.Random(options['seed'] + i),
+                                          start_barrier, results[i]))
+                   for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+
+        monitor = LockMonitor() if connection.vendor == 'postgresql' else None
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        # Failed requests are counted, their tracebacks would flood the output.
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            if monitor is not None:
+                monitor.start()
+            start_barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            request_logger.setLevel(level)
+            if monitor is not None:
+                monitor.stop()
+
+        return ([result for thread_results in results for result in thread_results], elapsed,
+                monitor.lock_waits if monitor else None, monitor.deadlocks if monitor else None)
+
+    def report(self, results, elapsed, lock_waits, deadlocks):
+        self.stdout.write('Operations: %d in %.2f s (%.1f ops/s)' % (len(results), elapsed, len(results) / elapsed))
+        for operation in OPERATIONS:
+            durations = sorted(duration for name, _, duration in results if name == operation)
+            if durations:
+                self.stdout.write('  %-14s %5d  p50 %8.1f ms  p95 %8.1f ms'
+                                  % (operation, len(durations), percentile(durations, 50) * 1000,
+                                     percentile(durations, 95) * 1000))
+
+        outcomes = Counter(outcome for _, outcome, _ in results)
+        self.stdout.write('Outcomes: ' + ', '.join('%s: %d' % item for item in sorted(outcomes.items())))
+        if lock_waits is None:
+            self.stdout.write('Lock waits: not available for ' + connection.vendor)
+        else:
+            self.stdout.write('Lock waits: %d samples with waiting backends, at most %d waiting at once'
+                              % lock_waits)
+            self.stdout.write('Deadlocks detected by the database: %d' % deadlocks)
+
+    @staticmethod
+    def tear_down(prefix, clients):
+        for client in clients:
+            client.logout()
+        Project.objects.filter(name__startswith=prefix + '_').delete()
+        Team.objects.filter(name__startswith=prefix + '_').delete()
+        User.objects.filter(username__startswith=prefix + '_').delete()
+
+
+def run_worker(clients, team_ids, project_ids, operations, rng, start_barrier, results):
+    urls = {operation: reverse(operation + '_url') for operation in OPERATIONS}
+    try:
+        start_barrier.wait()
+        for _ in range(operations):
+            client = rng.choice(clients)
+            operation = rng.choice(OPERATIONS)
+            if operation == 'team_join':
+                data = {'team_id': rng.choice(team_ids)}
+            elif operation in ('project_join', 'project_leave'):
+                data = {'project_id': rng.choice(project_ids)}
+            else:
+                data = {}
+
+            start = time.perf_counter()
+            response, exception = client.post(urls[operation], data)
+            results.append((operation, classify(response, exception), time.perf_counter() - start))
+    finally:
+        connection.close()
+
+
+def classify(response, exception):
+    if exception is None:
+        return 'ok' if response.status_code < 500 else 'error ' + repr(response.status_code)
+
+    code = getattr(exception.__cause__, 'pgcode', None)
+    if code == DEADLOCK_DETECTED:
+        return 'deadlock'
+    if code == LOCK_NOT_AVAILABLE or (isinstance(exception, DatabaseError) and 'locked' in str(exception)):
+        return 'lock timeout'
+    return type(exception).__name__
+
+
+class LockMonitor(object):
+    # Samples the backends waiting for a lock from its own connection while the threads run.
+    def __init__(self):
+        self.lock_waits = (0, 0)
+        self.deadlocks = 0
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self.run)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def run(self):
+        samples = most_waiting = 0
+        try:
+            with connection.cursor() as cursor:
+                deadlocks = self.count_deadlocks(cursor)
+                self._ready.set()
+                while not self._stop.is_set():
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity "
+                                   "WHERE datname = current_database() AND wait_event_type = 'Lock'")
+                    waiting = cursor.fetchone()[0]
+                    if waiting:
+                        samples += 1
+                        most_waiting = max(most_waiting, waiting)
+                    time.sleep(0.01)
+                # The statistics collector reports with a delay.
+                time.sleep(0.5)
+                self.deadlocks = self.count_deadlocks(cursor) - deadlocks
+        finally:
+            self.lock_waits = (samples, most_waiting)
+            self._ready.set()
+            connection.close()
+
+    @staticmethod
+    def count_deadlocks(cursor):
+        cursor.execute("SELECT pg_stat_clear_snapshot()")
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+def check_invariants(prefix):
+    violations = []
+    teams = {team.pk: team for team in Team.objects.filter(name__startswith=prefix + '_')}
+    members = {}
+    for student_id, team_id in Student.objects.filter(username__startswith=prefix + '_', team__isnull=False) \
+            .values_list('pk', 'team_id'):
+        members.setdefault(team_id, set()).add(student_id)
+
+    for team_id, team in sorted(teams.items()):
+        slots = {team.first_teammate_id, team.second_teammate_id} - {None}
+        if len(members.get(team_id, ())) > 2:
+            violations.append('Team %s has %d members.' % (team.name, len(members[team_id])))
+        if not slots:
+            violations.append('Team %s is empty but was not deleted.' % team.name)
+        if slots != members.get(team_id, set()):
+            violations.append('Team %s slots hold students %s, students %s point to it.'
+                              % (team.name, sorted(slots), sorted(members.get(team_id, ()))))
+
+    queues = {}
+    for team_id, project_id in Project.all_teams.through.objects.filter(team_id__in=list(teams)) \
+            .values_list('team_id', 'project_id'):
+        queues.setdefault(team_id, set()).add(project_id)
+
+    for team_id, team in sorted(teams.items()):
+        projects = queues.get(team_id, set())
+        if len(projects) > 1:
+            violations.append('Team %s is queued for %d projects.' % (team.name, len(projects)))
+        if projects != {team.applied_project_id} - {None}:
+            violations.append('Team %s points to project %s, it is queued for projects %s.'
+                              % (team.name, team.applied_project_id, sorted(projects)))
+    return violations
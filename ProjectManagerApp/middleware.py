@@ -1,6 +1,14 @@
+import time
+
+from django.conf import settings
 from django.http import HttpResponseNotAllowed
 from django.template import loader, RequestContext
 
+from ProjectManagerApp.service.RequestMetrics import record_request
+from ProjectManagerApp.service.RequestProfiler import get_profile_sort_key, start_profile, write_profile
+from ProjectManagerApp.service.RequestTrace import start_trace, finish_trace
+from ProjectManagerApp.service.ServiceTracing import export_trace
+
 
 class HttpResponseNotAllowedMiddleware(object):
     @staticmethod
@@ -9,3 +17,86 @@ class HttpResponseNotAllowedMiddleware(object):
             context = RequestContext(request, {'error_code': 405, 'error_message': 'Method not allowed'})
             response.content = loader.render_to_string("http_error.html", context)
         return response
+
+
+class RequestMetricsMiddleware(object):
+    @staticmethod
+    def process_request(request):
+        request._trace = start_trace()
+
+    @staticmethod
+    def process_view(request, view_func, view_args, view_kwargs):
+        request._handler_start = time.perf_counter()
+
+    @staticmethod
+    def process_response(request, response):
+        # From the view call to the end of the response middleware, so it includes the context processors, templates
+        # and queries run meanwhile.
+        trace = getattr(request, '_trace', None)
+        handler_start = getattr(request, '_handler_start', None)
+        if trace is not None and handler_start is not None:
+            trace.add_span('handler', time.perf_counter() - handler_start)
+
+        trace = finish_trace(trace)
+        if trace is None:
+            return response
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.url_name if resolver_match else 'unresolved'
+        record_request(view, trace)
+
+        trace.root_span.name = view
+        trace.root_span.attributes.update({'method': request.method, 'path': request.path,
+                                           'status': response.status_code})
+        export_trace(trace)
+
+        if getattr(settings, 'SERVER_TIMING', False) and resolver_match \
+                and resolver_match.func.__module__ == 'ProjectManagerApp.views':
+            response['Server-Timing'] = format_server_timing(trace)
+        return response
+
+
+class RequestProfilerMiddleware(object):
+    @staticmethod
+    def process_request(request):
+        if not getattr(settings, 'PROFILE_DIR', None) or not request.user.is_staff:
+            return
+
+        sort_key = get_profile_sort_key(request)
+        if sort_key is not None:
+            request._profile = (start_profile(), sort_key)
+
+    @staticmethod
+    def process_exception(request, exception):
+        # The response middleware may not run after an uncaught exception, the profiler must not stay enabled.
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            del request._profile
+            profile[0].disable()
+
+    @staticmethod
+    def process_response(request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+
+        del request._profile
+        profiler, sort_key = profile
+        resolver_match = getattr(request, 'resolver_match', None)
+        name = write_profile(profiler, resolver_match.url_name if resolver_match else 'unresolved', sort_key)
+        if name is not None:
+            response['X-Profile'] = name
+        return response
+
+
+def format_server_timing(trace):
+    spans = [
+        ('auth', trace.spans.get('auth', 0.0), 'Authentication'),
+        ('cp', trace.spans.get('context_processors', 0.0), 'Context processors'),
+        ('sql', trace.sql_time, 'SQL (' + repr(trace.sql_count) + ' queries)'),
+        ('tpl', trace.template_time, 'Template'),
+        ('handler', trace.spans.get('handler', 0.0), 'View with templates and response middleware'),
+        ('total', trace.duration, 'Total'),
+    ]
+    return ', '.join('%s;dur=%.2f;desc="%s"' % (name, duration * 1000, description)
+                     for name, duration, description in spans)
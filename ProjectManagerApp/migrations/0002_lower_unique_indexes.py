@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProjectManagerApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX "ProjectManagerApp_team_name_lower_uniq" '
+             'ON "ProjectManagerApp_team" (lower("name"))'],
+            ['DROP INDEX "ProjectManagerApp_team_name_lower_uniq"'],
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX "ProjectManagerApp_project_name_lower_uniq" '
+             'ON "ProjectManagerApp_project" (lower("name"))'],
+            ['DROP INDEX "ProjectManagerApp_project_name_lower_uniq"'],
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX "ProjectManagerApp_user_username_lower_uniq" '
+             'ON "auth_user" (lower("username"))'],
+            ['DROP INDEX "ProjectManagerApp_user_username_lower_uniq"'],
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX "ProjectManagerApp_user_email_lower_uniq" '
+             'ON "auth_user" (lower("email")) WHERE "email" <> \'\''],
+            ['DROP INDEX "ProjectManagerApp_user_email_lower_uniq"'],
+        ),
+    ]
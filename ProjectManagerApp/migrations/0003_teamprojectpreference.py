@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 18:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProjectManagerApp', '0002_lower_unique_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamProjectPreference',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ProjectManagerApp.Project')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_preferences', to='ProjectManagerApp.Team')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='teamprojectpreference',
+            unique_together=set([('team', 'rank'), ('team', 'project')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 19:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# SQLite adds a column by rebuilding the table, which drops the index created in 0002.
+CREATE_TEAM_NAME_LOWER_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS "ProjectManagerApp_team_name_lower_uniq" ' \
+                               'ON "ProjectManagerApp_team" (lower("name"))'
+
+
+def set_applied_projects(apps, schema_editor):
+    Project = apps.get_model('ProjectManagerApp', 'Project')
+    Team = apps.get_model('ProjectManagerApp', 'Team')
+
+    # A team is in one queue at most, the lowest project is kept otherwise.
+    applied_projects = {}
+    for project_id, team_id in Project.all_teams.through.objects.order_by('-project_id') \
+            .values_list('project_id', 'team_id'):
+        applied_projects[team_id] = project_id
+
+    teams = {}
+    for team_id, project_id in applied_projects.items():
+        teams.setdefault(project_id, []).append(team_id)
+    for project_id, team_ids in teams.items():
+        Team.objects.filter(pk__in=team_ids).update(applied_project_id=project_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProjectManagerApp', '0003_teamprojectpreference'),
+    ]
+
+    operations = [
+        migrations.RunSQL(migrations.RunSQL.noop, [CREATE_TEAM_NAME_LOWER_INDEX]),
+        migrations.AddField(
+            model_name='team',
+            name='applied_project',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ProjectManagerApp.Project'),
+        ),
+        migrations.RunSQL([CREATE_TEAM_NAME_LOWER_INDEX], migrations.RunSQL.noop),
+        migrations.RunPython(set_applied_projects, migrations.RunPython.noop),
+    ]
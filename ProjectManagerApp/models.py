@@ -29,6 +29,8 @@ class Team(models.Model):
     name = models.CharField(max_length=50, unique=True)
     first_teammate = models.OneToOneField(Student, null=True, related_name='+', on_delete=models.SET_NULL, unique=True)
     second_teammate = models.OneToOneField(Student, null=True, related_name='+', on_delete=models.SET_NULL, unique=True)
+    # The project whose queue the team is in, mirrors Project.all_teams.
+    applied_project = models.ForeignKey('Project', null=True, related_name='+', on_delete=models.SET_NULL)
 
 
 class Project(models.Model):
@@ -47,3 +49,12 @@ class Project(models.Model):
     assigned_team = models.OneToOneField(Team, null=True, related_name="project", on_delete=models.SET_NULL)
     all_teams = models.ManyToManyField(Team, related_name="+")
     author = models.ForeignKey(Teacher, null=False, related_name="+", on_delete=models.CASCADE)
+
+
+class TeamProjectPreference(models.Model):
+    team = models.ForeignKey(Team, null=False, related_name="project_preferences", on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, null=False, related_name="+", on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = (('team', 'rank'), ('team', 'project'))
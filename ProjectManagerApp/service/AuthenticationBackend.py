@@ -1,10 +1,12 @@
 from ProjectManagerApp.models import UserBase, Student, Teacher
+from ProjectManagerApp.service.RequestTrace import traced
+from ProjectManagerApp.service.UserCache import get_user_cache
 
 
 class AuthenticationBackend(object):
     def authenticate(self, username=None, password=None):
         try:
-            user_base = UserBase.objects.get(username=username)
+            user_base = UserBase.objects.select_related('student', 'teacher').get(username=username)
         except UserBase.DoesNotExist:
             return None
 
@@ -13,9 +15,17 @@ class AuthenticationBackend(object):
 
         return self.__map_base_user_to_derived_user(user_base)
 
+    @traced('auth')
     def get_user(self, user_id):
+        user_cache = get_user_cache()
+        if user_cache is None:
+            return self.__load_user(user_id)
+
+        return user_cache.load(user_id, self.__load_user)
+
+    def __load_user(self, user_id):
         try:
-            user_base = UserBase.objects.get(pk=user_id)
+            user_base = UserBase.objects.select_related('student', 'teacher').get(pk=user_id)
         except UserBase.DoesNotExist:
             return None
 
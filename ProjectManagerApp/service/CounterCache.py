@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ProjectManagerApp.models import Team, Project
+
+
+def get_count(model):
+    return cache.get_or_set(_get_key(model), model.objects.all().count,
+                            timeout=getattr(settings, 'COUNTER_CACHE_TIMEOUT', 300))
+
+
+def invalidate_count(model):
+    key = _get_key(model)
+    cache.delete(key)
+    # A concurrent request may recount before this transaction commits, so drop the key once more afterwards.
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_teams_count():
+    return get_count(Team)
+
+
+def get_projects_count():
+    return get_count(Project)
+
+
+def _get_key(model):
+    return 'counter:' + model._meta.label_lower
@@ -0,0 +1,75 @@
+class KeysetPage(object):
+    def __init__(self, object_list, previous_cursor, next_cursor):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    def __init__(self, queryset, page_size, key='pk'):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.key = key
+
+    def page(self, after=None, before=None):
+        after = self.__parse_cursor(after)
+        before = self.__parse_cursor(before)
+
+        # Cursors of deleted rows may point past either end of the list, the nearest full page is shown instead.
+        if before is not None:
+            page = self.__page_before(before)
+            return page if page.has_previous or len(page) == self.page_size else self.__page_after(None)
+
+        page = self.__page_after(after)
+        return page if page.object_list or after is None else self.__page_before(None)
+
+    def __page_after(self, after):
+        queryset = self.queryset.order_by(self.key)
+        if after is not None:
+            queryset = queryset.filter(**{self.key + '__gt': after})
+
+        object_list = list(queryset[:self.page_size + 1])
+        has_next = len(object_list) > self.page_size
+        object_list = object_list[:self.page_size]
+
+        previous_cursor = self.__get_key(object_list[0]) if after is not None and object_list else None
+        next_cursor = self.__get_key(object_list[-1]) if has_next else None
+        return KeysetPage(object_list, previous_cursor, next_cursor)
+
+    def __page_before(self, before):
+        queryset = self.queryset.order_by('-' + self.key)
+        if before is not None:
+            queryset = queryset.filter(**{self.key + '__lt': before})
+
+        object_list = list(queryset[:self.page_size + 1])
+        has_previous = len(object_list) > self.page_size
+        object_list = object_list[:self.page_size]
+        object_list.reverse()
+
+        previous_cursor = self.__get_key(object_list[0]) if has_previous else None
+        next_cursor = self.__get_key(object_list[-1]) if before is not None and object_list else None
+        return KeysetPage(object_list, previous_cursor, next_cursor)
+
+    def __get_key(self, obj):
+        return getattr(obj, self.key)
+
+    @staticmethod
+    def __parse_cursor(cursor):
+        try:
+            return int(cursor) if cursor is not None else None
+        except ValueError:
+            return None
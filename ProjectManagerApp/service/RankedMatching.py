@@ -0,0 +1,178 @@
+import numpy as np
+
+INFINITY = np.iinfo(np.int64).max // 4
+
+
+def solve_ranked_matching(team_ids, project_ids, ranks):
+    # Min-cost max-flow (source -> team -> project -> sink, cost = rank) solved with the primal-dual method:
+    # each phase computes shortest reduced distances with a vectorized Dial's algorithm and then augments along
+    # as many zero reduced cost paths as possible. The result matches the largest number of teams and, among
+    # such matchings, minimizes the sum of ranks.
+    team_ids = np.asarray(team_ids, dtype=np.int64)
+    project_ids = np.asarray(project_ids, dtype=np.int64)
+    ranks = np.asarray(ranks, dtype=np.int64)
+
+    if not len(team_ids):
+        return team_ids, project_ids, ranks
+
+    teams, team_index = np.unique(team_ids, return_inverse=True)
+    projects, project_index = np.unique(project_ids, return_inverse=True)
+
+    graph = _Graph(team_index, project_index, ranks, len(teams), len(projects))
+    while graph.update_potentials():
+        while graph.augment():
+            pass
+
+    matched = np.flatnonzero(graph.team_edge >= 0)
+    edges = graph.team_edge[matched]
+    return teams[matched], projects[graph.edge_project[edges]], graph.edge_cost[edges]
+
+
+class _Graph(object):
+    def __init__(self, team_index, project_index, ranks, teams_count, projects_count):
+        order = np.lexsort((ranks, team_index))
+        self.edge_team = team_index[order]
+        self.edge_project = project_index[order]
+        self.edge_cost = ranks[order]
+
+        self.teams_count = teams_count
+        self.projects_count = projects_count
+        self.edges_start = np.zeros(teams_count + 1, np.int64)
+        np.cumsum(np.bincount(self.edge_team, minlength=teams_count), out=self.edges_start[1:])
+        self.degree = np.diff(self.edges_start)
+
+        self.team_edge = np.full(teams_count, -1, np.int64)
+        self.project_team = np.full(projects_count, -1, np.int64)
+
+        self.team_potential = np.zeros(teams_count, np.int64)
+        self.project_potential = np.zeros(projects_count, np.int64)
+        self.sink_potential = 0
+
+    def update_potentials(self):
+        team_distance = np.full(self.teams_count, INFINITY, np.int64)
+        project_distance = np.full(self.projects_count, INFINITY, np.int64)
+        team_done = np.zeros(self.teams_count, bool)
+        project_done = np.zeros(self.projects_count, bool)
+
+        team_distance[self.team_edge < 0] = 0
+        sink_distance = INFINITY
+        level = 0
+
+        while level < sink_distance:
+            while True:
+                teams = np.flatnonzero((team_distance == level) & ~team_done)
+                team_done[teams] = True
+                self.__relax_team_edges(teams, level, project_distance)
+
+                projects = np.flatnonzero((project_distance == level) & ~project_done)
+                if not len(teams) and not len(projects):
+                    break
+                project_done[projects] = True
+
+                free_projects = projects[self.project_team[projects] < 0]
+                if len(free_projects):
+                    sink_distance = min(sink_distance,
+                                        level + int((self.project_potential[free_projects] - self.sink_potential).min()))
+
+                matched_teams = self.project_team[projects]
+                matched_teams = matched_teams[matched_teams >= 0]
+                matched_edges = self.team_edge[matched_teams]
+                np.minimum.at(team_distance, matched_teams,
+                              level - self.edge_cost[matched_edges]
+                              + self.project_potential[self.edge_project[matched_edges]]
+                              - self.team_potential[matched_teams])
+
+            level = min(_min_or_infinity(team_distance[~team_done]), _min_or_infinity(project_distance[~project_done]))
+            if level >= INFINITY:
+                break
+
+        if sink_distance >= INFINITY:
+            return False
+
+        self.team_potential += np.minimum(team_distance, sink_distance)
+        self.project_potential += np.minimum(project_distance, sink_distance)
+        self.sink_potential += sink_distance
+        return True
+
+    def __relax_team_edges(self, teams, level, project_distance):
+        degree = self.degree[teams]
+        total = int(degree.sum())
+        if not total:
+            return
+
+        segments_start = np.zeros(len(teams), np.int64)
+        np.cumsum(degree[:-1], out=segments_start[1:])
+        edges = np.arange(total) - np.repeat(segments_start, degree) + np.repeat(self.edges_start[teams], degree)
+        edges = edges[self.team_edge[self.edge_team[edges]] != edges]
+
+        projects = self.edge_project[edges]
+        np.minimum.at(project_distance, projects,
+                      level + self.edge_cost[edges] + self.team_potential[self.edge_team[edges]]
+                      - self.project_potential[projects])
+
+    def augment(self):
+        # Depth-first search for vertex-disjoint augmenting paths using only zero reduced cost edges.
+        edge_project = self.edge_project.tolist()
+        edge_cost = self.edge_cost.tolist()
+        edges_start = self.edges_start.tolist()
+        team_edge = self.team_edge.tolist()
+        project_team = self.project_team.tolist()
+        team_potential = self.team_potential.tolist()
+        project_potential = self.project_potential.tolist()
+        sink_potential = self.sink_potential
+
+        visited = bytearray(self.projects_count)
+        current_edge = edges_start[:-1]
+        augmented = 0
+
+        for root in range(self.teams_count):
+            if team_edge[root] >= 0:
+                continue
+
+            teams = [root]
+            path = []
+            while teams:
+                team = teams[-1]
+                advanced = False
+                edge = current_edge[team]
+                end = edges_start[team + 1]
+                while edge < end:
+                    project = edge_project[edge]
+                    if visited[project] or edge == team_edge[team] or \
+                            edge_cost[edge] + team_potential[team] - project_potential[project]:
+                        edge += 1
+                        continue
+
+                    visited[project] = 1
+                    current_edge[team] = edge + 1
+                    owner = project_team[project]
+                    if owner < 0:
+                        if project_potential[project] == sink_potential:
+                            path.append(edge)
+                            for path_team, path_edge in zip(teams, path):
+                                team_edge[path_team] = path_edge
+                                project_team[edge_project[path_edge]] = path_team
+                            augmented += 1
+                            teams = []
+                            advanced = True
+                            break
+                    elif project_potential[project] - edge_cost[team_edge[owner]] == team_potential[owner]:
+                        path.append(edge)
+                        teams.append(owner)
+                        advanced = True
+                        break
+                    edge += 1
+
+                if not advanced:
+                    current_edge[team] = end
+                    teams.pop()
+                    if path:
+                        path.pop()
+
+        self.team_edge[:] = team_edge
+        self.project_team[:] = project_team
+        return augmented
+
+
+def _min_or_infinity(values):
+    return int(values.min()) if len(values) else INFINITY
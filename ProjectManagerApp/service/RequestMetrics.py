@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+from ProjectManagerApp.service.UserCache import get_user_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+HISTOGRAMS = (
+    ('projectmanager_request_duration_seconds', 'Request latency by URL name.', DURATION_BUCKETS,
+     lambda trace: trace.duration),
+    ('projectmanager_request_sql_queries', 'SQL queries executed per request by URL name.', QUERY_COUNT_BUCKETS,
+     lambda trace: trace.sql_count),
+    ('projectmanager_request_sql_duration_seconds', 'SQL time per request by URL name.', DURATION_BUCKETS,
+     lambda trace: trace.sql_time),
+    ('projectmanager_request_template_duration_seconds', 'Template render time per request by URL name.',
+     DURATION_BUCKETS, lambda trace: trace.template_time),
+)
+
+COUNTERS = (
+    ('projectmanager_user_cache_hits_total', 'Authenticated users served from the users cache.'),
+    ('projectmanager_user_cache_misses_total', 'Authenticated users loaded from the database.'),
+)
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        # Each process writes its own file, named so that a restarted process never reuses the file of a dead one.
+        self.file_name = repr(os.getpid()) + '-' + uuid.uuid4().hex + '.json'
+        self.histograms = {name: {} for name, _, _, _ in HISTOGRAMS}
+        self.last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_request(self, view, trace):
+        with self._lock:
+            for name, _, buckets, value in HISTOGRAMS:
+                histogram = self.histograms[name].get(view)
+                if histogram is None:
+                    histogram = self.histograms[name][view] = {'buckets': [0] * (len(buckets) + 1), 'sum': 0}
+                observed = value(trace)
+                histogram['buckets'][bisect_left(buckets, observed)] += 1
+                histogram['sum'] += observed
+
+    def snapshot(self):
+        with self._lock:
+            histograms = json.loads(json.dumps(self.histograms))
+
+        counters = {name: 0 for name, _ in COUNTERS}
+        user_cache = get_user_cache()
+        if user_cache is not None:
+            counters['projectmanager_user_cache_hits_total'] = user_cache.hits
+            counters['projectmanager_user_cache_misses_total'] = user_cache.misses
+        return {'histograms': histograms, 'counters': counters}
+
+    def flush(self, directory):
+        self.last_flush = time.monotonic()
+        path = os.path.join(directory, self.file_name)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path + '.tmp', 'w') as metrics_file:
+                json.dump(self.snapshot(), metrics_file)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # Metrics must never fail the request, the next flush tries again.
+            pass
+
+    def maybe_flush(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            self.flush(directory)
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry():
+    return _registry
+
+
+def reset_metrics():
+    global _registry
+    _registry = MetricsRegistry()
+
+
+def record_request(view, trace):
+    _registry.record_request(view, trace)
+    _registry.maybe_flush()
+
+
+def collect_metrics():
+    snapshots = [_registry.snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory and os.path.isdir(directory):
+        stale_after = getattr(settings, 'METRICS_STALE_AFTER', 3600)
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(('.json', '.json.tmp')) or file_name == _registry.file_name:
+                continue
+            if _is_stale(os.path.join(directory, file_name), file_name, stale_after):
+                try:
+                    os.remove(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+                continue
+            if file_name.endswith('.tmp'):
+                continue
+            try:
+                with open(os.path.join(directory, file_name)) as metrics_file:
+                    snapshots.append(json.load(metrics_file))
+            except (OSError, ValueError):
+                continue
+
+    merged = {'histograms': {name: {} for name, _, _, _ in HISTOGRAMS}, 'counters': {name: 0 for name, _ in COUNTERS}}
+    for snapshot in snapshots:
+        for name, views in snapshot['histograms'].items():
+            for view, histogram in views.items():
+                total = merged['histograms'].setdefault(name, {}).get(view)
+                if total is None:
+                    merged['histograms'][name][view] = {'buckets': list(histogram['buckets']), 'sum': histogram['sum']}
+                else:
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+                    total['sum'] += histogram['sum']
+        for name, value in snapshot['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+    return merged
+
+
+def _is_stale(path, file_name, stale_after):
+    # Files of processes that exited (e.g. recycled mod_wsgi daemons) are never written again. A live process
+    # rewrites its file at every flush, so it is only removed once its process is gone.
+    try:
+        if time.time() - os.path.getmtime(path) < stale_after:
+            return False
+        os.kill(int(file_name.split('-', 1)[0]), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        return False
+    return False
+
+
+def render_prometheus(metrics):
+    lines = []
+    for name, description, buckets, _ in HISTOGRAMS:
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' histogram')
+        for view, histogram in sorted(metrics['histograms'].get(name, {}).items()):
+            label = 'view="' + _escape_label(view) + '"'
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), histogram['buckets']):
+                cumulative += count
+                lines.append(name + '_bucket{' + label + ',le="' + str(bound) + '"} ' + repr(cumulative))
+            lines.append(name + '_sum{' + label + '} ' + repr(histogram['sum']))
+            lines.append(name + '_count{' + label + '} ' + repr(cumulative))
+
+    for name, description in COUNTERS:
+        lines.append('# HELP ' + name + ' ' + description)
+        lines.append('# TYPE ' + name + ' counter')
+        lines.append(name + ' ' + repr(metrics['counters'].get(name, 0)))
+    return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
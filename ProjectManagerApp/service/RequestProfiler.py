@@ -0,0 +1,55 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls', 'ncalls', 'time')
+
+logger = logging.getLogger('ProjectManagerApp.profiler')
+
+
+def get_profile_sort_key(request):
+    # Profiling is requested with ?profile=<sort key> or the X-Profile header, an empty or unknown value
+    # sorts by cumulative time.
+    value = request.GET.get('profile', request.META.get('HTTP_X_PROFILE'))
+    if value is None:
+        return None
+    return value if value in PROFILE_SORT_KEYS else 'cumulative'
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def write_profile(profiler, name, sort_key):
+    profiler.disable()
+
+    directory = settings.PROFILE_DIR
+    # Profiles of the same view written in the same second by the same process must not overwrite each other.
+    base_name = '%s-%s-%d-%s' % (time.strftime('%Y%m%d-%H%M%S'), re.sub(r'[^\w-]', '_', name), os.getpid(),
+                                 uuid.uuid4().hex[:8])
+    path = os.path.join(directory, base_name)
+
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(sort_key).print_stats(getattr(settings, 'PROFILE_SUMMARY_LIMIT', 50))
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w') as summary_file:
+            summary_file.write(summary.getvalue())
+    except OSError:
+        # Profiling must never fail the profiled request.
+        logger.warning('Cannot write the profile %s to %s', base_name, directory, exc_info=True)
+        return None
+
+    return base_name
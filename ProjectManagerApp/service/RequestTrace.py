@@ -0,0 +1,194 @@
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.db.backends.utils import CursorWrapper
+from django.template.backends import django as django_backend
+
+from ProjectManagerApp.service.SlowQueryLog import is_slow_query, record_slow_query
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+_local = threading.local()
+
+
+class Span(object):
+    def __init__(self, trace_id, parent_id, name, kind):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.queries = 0
+        self.rows_written = 0
+        self.exception = None
+        self.attributes = {}
+
+    def finish(self, exception=None):
+        self.duration = time.perf_counter() - self.start
+        if exception is not None:
+            self.exception = type(exception).__name__
+
+    def to_dict(self):
+        span = {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': self.queries,
+            'rows_written': self.rows_written,
+            'exception': self.exception,
+        }
+        span.update(self.attributes)
+        return span
+
+
+class RequestTrace(object):
+    def __init__(self, name='request', kind='request'):
+        self.start = time.perf_counter()
+        self.duration = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.spans = {}
+        self.__depths = {}
+
+        self.root_span = Span(uuid.uuid4().hex, None, name, kind)
+        self.open_spans = [self.root_span]
+        self.closed_spans = []
+
+    @property
+    def template_time(self):
+        return self.spans.get('template', 0.0)
+
+    def record_query(self, sql, params, duration, rows_written=0):
+        self.sql_count += 1
+        self.sql_time += duration
+        # Spans include the queries of the spans nested in them.
+        for span in self.open_spans:
+            span.queries += 1
+            span.rows_written += rows_written
+
+    def open_span(self, name, kind):
+        span = Span(self.root_span.trace_id, self.open_spans[-1].span_id, name, kind)
+        self.open_spans.append(span)
+        return span
+
+    def close_span(self, span, exception=None):
+        span.finish(exception)
+        self.open_spans.remove(span)
+        self.closed_spans.append(span)
+
+    def get_spans(self):
+        return [self.root_span] + self.closed_spans
+
+    def add_span(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def measure(self, name, function, *args, **kwargs):
+        # Nested calls of the same span (e.g. a template rendered by another one) are counted in the outermost one.
+        depth = self.__depths.get(name, 0)
+        self.__depths[name] = depth + 1
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.__depths[name] = depth
+            if not depth:
+                self.add_span(name, time.perf_counter() - start)
+
+    def finish(self, exception=None):
+        self.duration = time.perf_counter() - self.start
+        self.root_span.finish(exception)
+
+
+def traced(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = get_current_trace()
+            if trace is None:
+                return function(*args, **kwargs)
+            return trace.measure(name, function, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name='request', kind='request'):
+    trace = RequestTrace(name, kind)
+    _local.trace = trace
+    return trace
+
+
+def get_current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def finish_trace(trace, exception=None):
+    if get_current_trace() is trace:
+        _local.trace = None
+    if trace is not None and trace.duration is None:
+        trace.finish(exception)
+    return trace
+
+
+class TracedCursorWrapper(CursorWrapper):
+    def execute(self, sql, params=None):
+        return self.__trace(self.cursor.execute, sql, params, explain=True)
+
+    def executemany(self, sql, param_list):
+        return self.__trace(self.cursor.executemany, sql, param_list, explain=False)
+
+    def __trace(self, execute, sql, params, explain):
+        succeeded = False
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params)
+            succeeded = True
+            return result
+        finally:
+            duration = time.perf_counter() - start
+            trace = get_current_trace()
+            if trace is not None:
+                rows_written = 0
+                if succeeded and sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+                    rows_written = max(self.cursor.rowcount, 0)
+                trace.record_query(sql, params, duration, rows_written)
+            if is_slow_query(duration):
+                # A failed query may have aborted the transaction, so it is logged without a plan.
+                record_slow_query(self.db, sql, params, duration, explain=explain and succeeded)
+
+
+def trace_connection(connection):
+    # Django 1.9 has no execute wrappers, so the cursors of every new connection are wrapped instead.
+    if getattr(connection, '_traced', False):
+        return
+
+    make_cursor = connection.make_cursor
+    make_debug_cursor = connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: TracedCursorWrapper(make_cursor(cursor), connection)
+    connection.make_debug_cursor = lambda cursor: TracedCursorWrapper(make_debug_cursor(cursor), connection)
+    connection._traced = True
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return TracedTemplate(super(DjangoTemplates, self).from_string(template_code))
+
+    def get_template(self, template_name, *args, **kwargs):
+        return TracedTemplate(super(DjangoTemplates, self).get_template(template_name, *args, **kwargs))
+
+
+class TracedTemplate(django_backend.Template):
+    def __init__(self, template):
+        super(TracedTemplate, self).__init__(template.template, template.backend)
+
+    @traced('template')
+    def render(self, context=None, request=None):
+        return super(TracedTemplate, self).render(context, request)
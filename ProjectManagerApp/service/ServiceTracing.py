@@ -0,0 +1,49 @@
+import json
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+from ProjectManagerApp.service.RequestTrace import get_current_trace, start_trace, finish_trace
+
+_export_lock = threading.Lock()
+
+
+def traced_service(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = get_current_trace()
+        if trace is None:
+            # Called outside of a request (e.g. from a management command), the call is traced on its own.
+            trace = start_trace(function.__name__, 'service')
+            try:
+                result = function(*args, **kwargs)
+            except Exception as exc:
+                export_trace(finish_trace(trace, exc))
+                raise
+            export_trace(finish_trace(trace))
+            return result
+
+        span = trace.open_span(function.__name__, 'service')
+        try:
+            result = function(*args, **kwargs)
+        except Exception as exc:
+            trace.close_span(span, exc)
+            raise
+        trace.close_span(span)
+        return result
+    return wrapper
+
+
+def export_trace(trace):
+    path = getattr(settings, 'SERVICE_TRACE_FILE', None)
+    if not path:
+        return
+
+    lines = ''.join(json.dumps(span.to_dict()) + '\n' for span in trace.get_spans())
+    try:
+        with _export_lock, open(path, 'a') as trace_file:
+            trace_file.write(lines)
+    except OSError:
+        # Tracing must never fail the traced call.
+        pass
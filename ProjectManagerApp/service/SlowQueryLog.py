@@ -0,0 +1,137 @@
+import logging
+import os
+import sys
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger('ProjectManagerApp.slow_queries')
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+EXPLAINABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTRUMENTATION_FILES = ('RequestTrace.py', 'SlowQueryLog.py')
+
+
+class SlowQuery(object):
+    def __init__(self, duration, sql, params, caller, view, plan):
+        self.timestamp = timezone.now()
+        self.duration = duration
+        self.sql = sql
+        self.params = params
+        self.caller = caller
+        self.view = view
+        self.plan = plan
+
+
+class SlowQueryBuffer(object):
+    def __init__(self, size):
+        self.size = size
+        self._queries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def append(self, query):
+        with self._lock:
+            self._queries.append(query)
+
+    def get_queries(self):
+        with self._lock:
+            return list(reversed(self._queries))
+
+
+_buffer = None
+_local = threading.local()
+
+
+def get_slow_query_buffer():
+    global _buffer
+    size = getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 100)
+    if _buffer is None or _buffer.size != size:
+        _buffer = SlowQueryBuffer(size)
+    return _buffer
+
+
+def reset_slow_query_buffer():
+    global _buffer
+    _buffer = None
+
+
+def is_slow_query(duration):
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+    return threshold is not None and duration >= threshold and not getattr(_local, 'explaining', False)
+
+
+def record_slow_query(connection, sql, params, duration, explain=True):
+    caller, view = find_callers()
+    plan = explain_query(connection, sql, params) if explain else None
+    if not getattr(settings, 'SLOW_QUERY_LOG_PARAMS', False):
+        params = redact_params(params)
+    query = SlowQuery(duration, sql, params, caller, view, plan)
+
+    get_slow_query_buffer().append(query)
+    logger.warning('Slow query (%.3f s) in %s, view %s:\n%s\nParams: %r\nPlan:\n%s',
+                   duration, caller, view, sql, params, plan)
+    return query
+
+
+def redact_params(params):
+    # Bound values can hold password hashes and emails, only their types are kept.
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def explain_query(connection, sql, params):
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+        return None
+
+    _local.explaining = True
+    try:
+        # The savepoint keeps a failed plan from breaking the current transaction, and the raw cursor keeps the
+        # plan query out of the request trace.
+        with transaction.atomic(using=connection.alias):
+            cursor = connection._cursor()
+            try:
+                cursor.execute(prefix + sql, params)
+                return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
+    except Exception as exc:
+        return 'EXPLAIN failed: ' + repr(exc)
+    finally:
+        _local.explaining = False
+
+
+def find_callers():
+    # The innermost application function running the query, and the outermost view it was called from.
+    caller = view = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if path.startswith(APP_DIR) and os.path.basename(path) not in INSTRUMENTATION_FILES:
+            name = _get_function_name(frame)
+            if caller is None:
+                caller = name
+            if os.path.basename(path) == 'views.py':
+                view = name
+        frame = frame.f_back
+    return caller, view
+
+
+def _get_function_name(frame):
+    name = frame.f_code.co_name
+    instance = frame.f_locals.get('self')
+    if instance is not None:
+        name = type(instance).__name__ + '.' + name
+    return name
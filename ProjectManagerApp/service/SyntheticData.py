@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db.models import Case, When, Value, IntegerField, Max
+from django.utils import timezone
+
+from ProjectManagerApp.models import UserBase, Student, Teacher, Team, Project, TeamProjectPreference
+from ProjectManagerApp.service.CounterCache import invalidate_count
+
+BATCH_SIZE = 500
+
+
+class SyntheticCohort(object):
+    def __init__(self, teacher_ids, student_ids, team_ids, project_ids, queued_teams, preferences):
+        self.teacher_ids = teacher_ids
+        self.student_ids = student_ids
+        self.team_ids = team_ids
+        self.project_ids = project_ids
+        self.queued_teams = queued_teams
+        self.preferences = preferences
+
+
+def seed_cohort(prefix, students, teams, projects, teachers, queue_length, rng, password):
+    # All users share one password, hashing it for every user would take longer than inserting them.
+    password = make_password(password)
+
+    teacher_ids = _create_users(Teacher, prefix + '_teacher_', teachers, password, lambda i: {})
+    team_ids = _create_teams(prefix + '_team_', teams)
+
+    # Teams are filled with first teammates, then with second ones, the students left over have no team.
+    team_of = [team_ids[i % teams] if teams and i < 2 * teams else None for i in range(students)]
+    first_student_no = (Student.objects.aggregate(Max('student_no'))['student_no__max'] or 0) + 1
+    student_ids = _create_users(Student, prefix + '_student_', students, password,
+                                lambda i: {'student_no': first_student_no + i, 'team_id': team_of[i],
+                                           'status': Student.STUDENT_STATUS_UNASSIGNED})
+    _set_teammates(team_ids, student_ids)
+
+    project_ids = _create_projects(prefix + '_project_', projects, teacher_ids, rng)
+    queued_teams = _create_queues(project_ids, team_ids, queue_length, rng)
+    _set_applied_projects(queued_teams)
+    preferences = _create_preferences(queued_teams, project_ids, rng)
+
+    # Bulk inserts send no post_save signals.
+    invalidate_count(Team)
+    invalidate_count(Project)
+
+    return SyntheticCohort(teacher_ids, student_ids, team_ids, project_ids, queued_teams, preferences)
+
+
+def _create_users(model, username_prefix, count, password, get_fields):
+    now = timezone.now()
+    User.objects.bulk_create([User(username=username_prefix + repr(i), email=username_prefix + repr(i) + '@example.com',
+                                   password=password, date_joined=now) for i in range(count)], BATCH_SIZE)
+    ids = _get_ids(User.objects.filter(username__startswith=username_prefix), 'username', username_prefix, count)
+
+    # bulk_create refuses models with multi-table inheritance, so the table of each model in the chain is filled
+    # separately.
+    _insert(UserBase, [UserBase(user_ptr_id=user_id) for user_id in ids])
+    _insert(model, [model(userbase_ptr_id=user_id, **get_fields(i)) for i, user_id in enumerate(ids)])
+    return ids
+
+
+def _create_teams(name_prefix, count):
+    Team.objects.bulk_create([Team(name=name_prefix + repr(i)) for i in range(count)], BATCH_SIZE)
+    return _get_ids(Team.objects.filter(name__startswith=name_prefix), 'name', name_prefix, count)
+
+
+def _set_teammates(team_ids, student_ids):
+    for field, offset in (('first_teammate', 0), ('second_teammate', len(team_ids))):
+        teammates = dict(zip(team_ids, student_ids[offset:offset + len(team_ids)]))
+        batch_ids = sorted(teammates)
+        for start in range(0, len(batch_ids), BATCH_SIZE):
+            batch = batch_ids[start:start + BATCH_SIZE]
+            Team.objects.filter(pk__in=batch).update(**{field: Case(
+                *[When(pk=team_id, then=Value(teammates[team_id])) for team_id in batch],
+                output_field=IntegerField())})
+
+
+def _create_projects(name_prefix, count, teacher_ids, rng):
+    Project.objects.bulk_create([Project(name=name_prefix + repr(i), description='Synthetic project ' + repr(i),
+                                         status=Project.PROJECT_STATUS_OPEN, author_id=rng.choice(teacher_ids))
+                                 for i in range(count)], BATCH_SIZE)
+    return _get_ids(Project.objects.filter(name__startswith=name_prefix), 'name', name_prefix, count)
+
+
+def _create_queues(project_ids, team_ids, queue_length, rng):
+    # A team waits in one queue at most, like with user_team_join_project. Queue lengths are spread evenly between 0
+    # and twice the mean until the teams run out, projects are visited in random order so that no project range is
+    # favoured.
+    queued_teams = {project_id: [] for project_id in project_ids}
+    free_team_ids = list(team_ids)
+    rng.shuffle(free_team_ids)
+    shuffled_project_ids = list(project_ids)
+    rng.shuffle(shuffled_project_ids)
+    for project_id in shuffled_project_ids:
+        length = min(rng.randint(0, 2 * queue_length), len(free_team_ids))
+        queued_teams[project_id] = free_team_ids[len(free_team_ids) - length:]
+        del free_team_ids[len(free_team_ids) - length:]
+
+    through = Project.all_teams.through
+    through.objects.bulk_create([through(project_id=project_id, team_id=team_id)
+                                 for project_id, teams in queued_teams.items() for team_id in teams], BATCH_SIZE)
+    return queued_teams
+
+
+def _set_applied_projects(queued_teams):
+    applied_projects = {team_id: project_id for project_id, teams in queued_teams.items() for team_id in teams}
+
+    batch_ids = sorted(applied_projects)
+    for start in range(0, len(batch_ids), BATCH_SIZE):
+        batch = batch_ids[start:start + BATCH_SIZE]
+        Team.objects.filter(pk__in=batch).update(applied_project=Case(
+            *[When(pk=team_id, then=Value(applied_projects[team_id])) for team_id in batch],
+            output_field=IntegerField()))
+
+
+def _create_preferences(queued_teams, project_ids, rng):
+    # Queued teams rank the project they wait for first, followed by a few other projects.
+    preferences = {}
+    for project_id, teams in sorted(queued_teams.items()):
+        for team_id in teams:
+            count = rng.randint(1, min(settings.PROJECT_PREFERENCES_MAX, len(project_ids)))
+            others = [other_id for other_id in rng.sample(project_ids, count) if other_id != project_id]
+            preferences[team_id] = [project_id] + others[:count - 1]
+
+    TeamProjectPreference.objects.bulk_create([
+        TeamProjectPreference(team_id=team_id, project_id=project_id, rank=rank)
+        for team_id, projects in preferences.items() for rank, project_id in enumerate(projects, 1)], BATCH_SIZE)
+    return preferences
+
+
+def _get_ids(queryset, field, prefix, count):
+    # Django 1.9 does not set the primary keys of bulk created objects, they are read back by their unique names.
+    ids = dict(queryset.values_list(field, 'pk'))
+    return [ids[prefix + repr(i)] for i in range(count)]
+
+
+def _insert(model, objects):
+    model._base_manager.all()._batched_insert(objects, model._meta.local_concrete_fields, BATCH_SIZE)
@@ -0,0 +1,139 @@
+import random
+import time
+from collections import Counter
+
+from django.db.models import Case, When, Value, IntegerField, Q
+
+from ProjectManagerApp.models import Student, Team, Project, TeamProjectPreference
+from ProjectManagerApp.signals import users_updated
+
+WRITE_BATCH_SIZE = 500
+
+ASSIGNMENT_MODE_LOTTERY = 'lottery'
+ASSIGNMENT_MODE_PREFERENCES = 'preferences'
+ASSIGNMENT_MODES = (ASSIGNMENT_MODE_LOTTERY, ASSIGNMENT_MODE_PREFERENCES)
+
+
+class AssignmentResult(object):
+    def __init__(self, mode, seed, assignments, rank_distribution, load_time, solve_time, write_time):
+        self.mode = mode
+        self.seed = seed
+        self.assignments = assignments
+        self.projects_assigned = len(assignments)
+        self.rank_distribution = rank_distribution
+        self.load_time = load_time
+        self.solve_time = solve_time
+        self.write_time = write_time
+
+    @property
+    def dry_run(self):
+        return self.write_time is None
+
+
+def new_seed():
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+def run_assignment(mode=ASSIGNMENT_MODE_LOTTERY, seed=None, dry_run=False):
+    # The lottery draws from its own generator, so the same seed and the same queues always give the same result.
+    if mode == ASSIGNMENT_MODE_LOTTERY and seed is None:
+        seed = new_seed()
+
+    start = time.perf_counter()
+    if mode == ASSIGNMENT_MODE_PREFERENCES:
+        preferences = load_team_preferences()
+        loaded = time.perf_counter()
+        assignments, rank_distribution = match_preferences(preferences)
+    else:
+        queues = load_project_queues()
+        loaded = time.perf_counter()
+        assignments, rank_distribution = draw_teams(queues, random.Random(seed)), Counter()
+    solved = time.perf_counter()
+
+    write_time = None
+    if not dry_run:
+        write_assignments(assignments)
+        write_time = time.perf_counter() - solved
+
+    return AssignmentResult(mode, seed if mode == ASSIGNMENT_MODE_LOTTERY else None, assignments, rank_distribution,
+                            loaded - start, solved - loaded, write_time)
+
+
+def load_project_queues(project_ids=None):
+    rows = Project.all_teams.through.objects.filter(project__assigned_team__isnull=True,
+                                                    team__project__isnull=True,
+                                                    team__first_teammate__isnull=False,
+                                                    team__second_teammate__isnull=False)
+    if project_ids is not None:
+        rows = rows.filter(project_id__in=project_ids)
+
+    queues = {}
+    for project_id, team_id, first_teammate_id, second_teammate_id in rows \
+            .order_by('project_id', 'team_id') \
+            .values_list('project_id', 'team_id', 'team__first_teammate_id', 'team__second_teammate_id'):
+        queues.setdefault(project_id, []).append((team_id, first_teammate_id, second_teammate_id))
+    return queues
+
+
+def draw_teams(queues, rng=random):
+    assignments = {}
+    assigned_team_ids = set()
+    for project_id in sorted(queues):
+        candidates = [team for team in queues[project_id] if team[0] not in assigned_team_ids]
+        if candidates:
+            team = candidates[rng.randint(0, len(candidates) - 1)]
+            assignments[project_id] = team
+            assigned_team_ids.add(team[0])
+    return assignments
+
+
+def load_team_preferences():
+    return list(TeamProjectPreference.objects
+                .filter(project__assigned_team__isnull=True,
+                        team__project__isnull=True,
+                        team__first_teammate__isnull=False,
+                        team__second_teammate__isnull=False)
+                .values_list('team_id', 'project_id', 'rank', 'team__first_teammate_id', 'team__second_teammate_id'))
+
+
+def match_preferences(preferences):
+    # Imported here, so that the lottery and the rest of the app work without numpy.
+    from ProjectManagerApp.service.RankedMatching import solve_ranked_matching
+
+    teammates = {team_id: (first_teammate_id, second_teammate_id)
+                 for team_id, _, _, first_teammate_id, second_teammate_id in preferences}
+
+    team_ids, project_ids, ranks = solve_ranked_matching([preference[0] for preference in preferences],
+                                                         [preference[1] for preference in preferences],
+                                                         [preference[2] for preference in preferences])
+
+    assignments = {}
+    rank_distribution = Counter()
+    for team_id, project_id, rank in zip(team_ids.tolist(), project_ids.tolist(), ranks.tolist()):
+        assignments[project_id] = (team_id,) + teammates[team_id]
+        rank_distribution[rank] += 1
+    return assignments, rank_distribution
+
+
+def write_assignments(assignments):
+    project_ids = sorted(assignments)
+    for start in range(0, len(project_ids), WRITE_BATCH_SIZE):
+        batch = project_ids[start:start + WRITE_BATCH_SIZE]
+
+        Project.objects.filter(pk__in=batch).update(
+            assigned_team=Case(*[When(pk=project_id, then=Value(assignments[project_id][0])) for project_id in batch],
+                               output_field=IntegerField()),
+            status=Project.PROJECT_STATUS_CLOSED)
+
+        # A team matched by its preferences may wait in the queue of another project.
+        team_ids = [assignments[project_id][0] for project_id in batch]
+        Project.all_teams.through.objects.filter(Q(project_id__in=batch) | Q(team_id__in=team_ids)).delete()
+        Team.objects.filter(Q(pk__in=team_ids) | Q(applied_project_id__in=batch)).update(applied_project=None)
+
+        TeamProjectPreference.objects.filter(team_id__in=team_ids).delete()
+
+        student_ids = [student_id for project_id in batch for student_id in assignments[project_id][1:]]
+        Student.objects.filter(pk__in=student_ids).update(status=Student.STUDENT_STATUS_ASSIGNED)
+        users_updated.send(sender=Student, user_ids=student_ids)
+
+    return len(project_ids)
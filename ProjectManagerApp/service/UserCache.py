@@ -0,0 +1,158 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+USER_CACHE_LOCAL = 'local'
+USER_CACHE_SHARED = 'shared'
+
+
+class UserCache(object):
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    def load(self, user_id, loader):
+        user = self.get(user_id)
+        if user is not None:
+            self._count(hit=True)
+            return user
+
+        self._count(hit=False)
+        return self.load_missing(user_id, loader)
+
+    def load_missing(self, user_id, loader):
+        user = loader(user_id)
+        if user is not None:
+            self.set(user_id, user)
+        return user
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def set(self, user_id, user):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def _count(self, hit):
+        with self._counters_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class LocalUserCache(UserCache):
+    def __init__(self, timeout, size):
+        super(LocalUserCache, self).__init__(timeout)
+        self.size = size
+        self._users = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def load_missing(self, user_id, loader):
+        # A user changed while being loaded must not be stored, otherwise the stale copy would outlive the invalidation.
+        with self._lock:
+            generation = self._generation
+
+        user = loader(user_id)
+        if user is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self.__store(user_id, user)
+        return user
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+
+            expires, user = entry
+            if expires <= time.monotonic():
+                del self._users[user_id]
+                return None
+
+            self._users.move_to_end(user_id)
+            return copy.deepcopy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self.__store(user_id, user)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._users.pop(user_id, None)
+
+    def __store(self, user_id, user):
+        self._users[user_id] = (time.monotonic() + self.timeout, copy.deepcopy(user))
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.size:
+            self._users.popitem(last=False)
+
+
+class SharedUserCache(UserCache):
+    def get(self, user_id):
+        return cache.get(_get_key(user_id))
+
+    def set(self, user_id, user):
+        cache.set(_get_key(user_id), user, timeout=self.timeout)
+
+    def delete(self, user_id):
+        cache.delete(_get_key(user_id))
+
+
+_user_caches = {}
+
+
+def get_user_cache():
+    backend = getattr(settings, 'USER_CACHE', None)
+    if backend is None:
+        return None
+
+    if backend not in _user_caches:
+        timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 60)
+        if backend == USER_CACHE_LOCAL:
+            _user_caches[backend] = LocalUserCache(timeout, getattr(settings, 'USER_CACHE_SIZE', 1000))
+        elif backend == USER_CACHE_SHARED:
+            _user_caches[backend] = SharedUserCache(timeout)
+        else:
+            raise ValueError('Unknown user cache: ' + repr(backend))
+    return _user_caches[backend]
+
+
+def invalidate_users(user_ids):
+    user_cache = get_user_cache()
+    if user_cache is None:
+        return
+
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    for user_id in user_ids:
+        user_cache.delete(user_id)
+    # A concurrent request may reload the users before this transaction commits, so drop them once more afterwards.
+    transaction.on_commit(lambda: [user_cache.delete(user_id) for user_id in user_ids])
+
+
+def reset_user_caches():
+    _user_caches.clear()
+
+
+@receiver(setting_changed)
+def reset_user_caches_on_setting_changed(setting, **kwargs):
+    if setting.startswith('USER_CACHE'):
+        reset_user_caches()
+
+
+def _get_key(user_id):
+    return 'user:' + repr(user_id)
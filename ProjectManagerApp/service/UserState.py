@@ -0,0 +1,63 @@
+from django.db.models import Q
+
+from ProjectManagerApp.models import Student, Teacher, Team, Project
+
+
+class UserState(object):
+    def __init__(self, user):
+        self.user = user
+        self.is_student = isinstance(user, Student)
+        self.is_teacher = isinstance(user, Teacher)
+        self.has_user_team = self.is_student and user.team_id is not None
+        self.__team = None
+        self.__projects = None
+
+    @property
+    def team(self):
+        if self.__team is None:
+            self.__team = self.__load_team()
+        return self.__team
+
+    @property
+    def assigned_project(self):
+        return self.__get_projects()[0]
+
+    @property
+    def applied_project(self):
+        return self.__get_projects()[1]
+
+    def __get_projects(self):
+        if self.__projects is None:
+            self.__projects = self.__load_projects()
+        return self.__projects
+
+    def __load_team(self):
+        if not self.has_user_team:
+            return False
+        return Team.objects.get(pk=self.user.team_id)
+
+    def __load_projects(self):
+        assigned_project = False
+        applied_project = False
+
+        if not self.has_user_team:
+            return assigned_project, applied_project
+
+        team_id = self.user.team_id
+        applied_project_id = Team.objects.filter(pk=team_id).values('applied_project_id')
+        projects = Project.objects.filter(Q(assigned_team_id=team_id) | Q(pk__in=applied_project_id))
+        for project in projects:
+            if project.assigned_team_id == team_id:
+                assigned_project = project
+            else:
+                applied_project = project
+
+        return assigned_project, applied_project
+
+
+def get_user_state(request):
+    state = getattr(request, '_user_state', None)
+    if state is None or state.user is not request.user:
+        state = UserState(request.user)
+        request._user_state = state
+    return state
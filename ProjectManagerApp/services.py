@@ -1,118 +1,200 @@
 from ProjectManagerApp.exceptions import UserAlreadyInTeam, MustBeStudent, UserNotInTeam, MustBeTeacher, \
     ProjectHasAssignedTeam, UserWithGivenUsernameAlreadyExists, StudentWithGivenStudentNoAlreadyExists, \
     TeamAlreadyInProjectQueue, TeamNotInProjectQueue, UserWithGivenEmailAlreadyExists, InvalidPassword, \
-    TeamIsFull, UserAssignedToProject, TeamWithGivenNameAlreadyExists, ProjectWithGivenNameAlreadyExists, MustBeAuthor
-from ProjectManagerApp.models import Student, Team, Teacher, Project, UserBase
-import random
-
-
+    TeamIsFull, UserAssignedToProject, TeamWithGivenNameAlreadyExists, ProjectWithGivenNameAlreadyExists, MustBeAuthor, \
+    TooManyProjectPreferences, DuplicateProjectPreference
+from ProjectManagerApp.models import Student, Team, Teacher, Project, UserBase, TeamProjectPreference
+from ProjectManagerApp.service.TeamAssignment import load_project_queues, draw_teams, write_assignments, \
+    run_assignment, ASSIGNMENT_MODE_LOTTERY, ASSIGNMENT_MODE_PREFERENCES
+from ProjectManagerApp.service.ServiceTracing import traced_service
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+
+
+@traced_service
 def user_join_team(user, team):
     if not isinstance(user, Student):
         raise MustBeStudent
 
-    if user.team:
+    if user.team_id is not None:
         raise UserAlreadyInTeam
 
-    if team.first_teammate and team.second_teammate:
+    if team.first_teammate_id is not None and team.second_teammate_id is not None:
         raise TeamIsFull
 
-    if team.first_teammate is None:
-        team.first_teammate = user
-    elif team.second_teammate is None:
-        team.second_teammate = user
-    team.save(force_update=True)
+    with transaction.atomic():
+        first_teammate_id, second_teammate_id = lock_team(team.pk)
+        team_id, _ = lock_student(user.pk)
+
+        if team_id is not None:
+            raise UserAlreadyInTeam
+
+        if first_teammate_id is not None and second_teammate_id is not None:
+            raise TeamIsFull
 
-    user.team = team
-    user.save()
+        if (team.first_teammate_id, team.second_teammate_id) != (first_teammate_id, second_teammate_id):
+            team.refresh_from_db(fields=['first_teammate', 'second_teammate'])
 
+        if team.first_teammate_id is None:
+            team.first_teammate = user
+            team.save(update_fields=['first_teammate'])
+        else:
+            team.second_teammate = user
+            team.save(update_fields=['second_teammate'])
 
+        user.team = team
+        user.save(update_fields=['team'])
+
+
+@traced_service
 def user_create_team(user, team_name):
     if not isinstance(user, Student):
         raise MustBeStudent
 
-    if user.team:
+    if user.team_id is not None:
         raise UserAlreadyInTeam
 
-    try:
-        if Team.objects.get(name__iexact=team_name):
-            raise TeamWithGivenNameAlreadyExists
-    except Team.DoesNotExist:
-        pass
+    with transaction.atomic():
+        team_id, _ = lock_student(user.pk)
+        if team_id is not None:
+            raise UserAlreadyInTeam
 
-    team = Team()
-    team.name = team_name
-    team.save()
+        team = Team()
+        team.name = team_name
+        team.first_teammate = user
+        try:
+            with transaction.atomic():
+                team.save()
+        except IntegrityError:
+            raise TeamWithGivenNameAlreadyExists
 
-    user_join_team(user, team)
+        user.team = team
+        user.save(update_fields=['team'])
 
     return team
 
 
+@traced_service
 def user_team_leave(user):
     if not isinstance(user, Student):
         raise MustBeStudent
 
-    if not user.team:
+    if user.team_id is None:
         raise UserNotInTeam
 
     if user.status == Student.STUDENT_STATUS_ASSIGNED:
         raise UserAssignedToProject
 
-    team = user.team
+    with transaction.atomic():
+        try:
+            first_teammate_id, second_teammate_id = lock_team(user.team_id)
+        except Team.DoesNotExist:
+            raise UserNotInTeam
+        team_id, status = lock_student(user.pk)
+
+        if team_id != user.team_id:
+            raise UserNotInTeam
+
+        if status == Student.STUDENT_STATUS_ASSIGNED:
+            raise UserAssignedToProject
+
+        user.team = None
+        user.save(update_fields=['team'])
+
+        # The remaining teammate always takes the first slot.
+        if first_teammate_id == user.pk and second_teammate_id is not None:
+            Team.objects.filter(pk=team_id).update(first_teammate=second_teammate_id, second_teammate=None)
+        elif first_teammate_id is not None and second_teammate_id == user.pk:
+            Team.objects.filter(pk=team_id).update(second_teammate=None)
+        else:
+            Team.objects.get(pk=team_id).delete()
+
 
-    if team.first_teammate == user:
-        team.first_teammate = None
-        if team.second_teammate is not None:
-            team.first_teammate = team.second_teammate
-            team.second_teammate = None
-    elif team.second_teammate == user:
-        team.second_teammate = None
+@traced_service
+def lock_team(team_id):
+    # Every service locks the team before its students, so that concurrent joins and leaves wait for each other
+    # instead of deadlocking.
+    return Team.objects.select_for_update().filter(pk=team_id) \
+        .values_list('first_teammate_id', 'second_teammate_id').get()
 
-    if team.first_teammate is None and team.second_teammate is None:
-        team.delete()
-    else:
-        team.save(force_update=True)
 
-    user.team = None
-    user.save()
+@traced_service
+def lock_student(user_id):
+    return Student.objects.select_for_update().filter(pk=user_id).values_list('team_id', 'status').get()
 
-    if team.first_teammate is not None:
-        team.first_teammate.team.refresh_from_db()
 
+def lock_team_member(user):
+    # The user may be a cached copy, so the membership is checked again under the locks.
+    try:
+        lock_team(user.team_id)
+    except Team.DoesNotExist:
+        raise UserNotInTeam
+    team_id, status = lock_student(user.pk)
+
+    if team_id != user.team_id:
+        raise UserNotInTeam
 
+    return status
+
+
+@traced_service
 def assign_team_to_project(project):
-    ready_teams = project.all_teams.exclude(first_teammate__isnull=True).exclude(second_teammate__isnull=True)
-    count = ready_teams.count()
-    if count:
-        index = random.randint(0, count - 1)
-        result = ready_teams.all()[index]
-        project.assigned_team = result
-        if result.first_teammate and result.second_teammate:
-            result.first_teammate.status = Student.STUDENT_STATUS_ASSIGNED
-            result.second_teammate.status = Student.STUDENT_STATUS_ASSIGNED
-            result.first_teammate.save(force_update=True)
-            result.second_teammate.save(force_update=True)
-            project.status = Project.PROJECT_STATUS_CLOSED
-            for team in project.all_teams.all():
-                project.all_teams.remove(team)
-            project.save(force_update=True)
-            return 1
-    return 0
+    projects_assigned = write_assignments(draw_teams(load_project_queues([project.pk])))
+    if projects_assigned:
+        project.refresh_from_db()
+    return projects_assigned
 
 
-def assign_teams_to_projects(user):
+@traced_service
+def assign_teams_to_projects(user, seed=None, dry_run=False):
     if not isinstance(user, Teacher):
         raise MustBeTeacher
 
-    projects_assigned = 0
-    for project in Project.objects.all():
-        if not project.assigned_team:
-            result = assign_team_to_project(project)
-            projects_assigned += result
+    return run_assignment(ASSIGNMENT_MODE_LOTTERY, seed, dry_run)
 
-    return projects_assigned
 
+@traced_service
+def assign_teams_to_projects_by_preferences(user, dry_run=False):
+    if not isinstance(user, Teacher):
+        raise MustBeTeacher
+
+    return run_assignment(ASSIGNMENT_MODE_PREFERENCES, dry_run=dry_run)
+
+
+@traced_service
+def user_team_set_project_preferences(user, projects):
+    if not isinstance(user, Student):
+        raise MustBeStudent
+
+    if user.team_id is None:
+        raise UserNotInTeam
+
+    if user.status == Student.STUDENT_STATUS_ASSIGNED:
+        raise UserAssignedToProject
+
+    if len(projects) > settings.PROJECT_PREFERENCES_MAX:
+        raise TooManyProjectPreferences
+
+    if len(set(project.pk for project in projects)) != len(projects):
+        raise DuplicateProjectPreference
+
+    for project in projects:
+        if project.assigned_team_id:
+            raise ProjectHasAssignedTeam
+
+    # Teammates saving at the same time would both insert the ranks their deletes did not see.
+    with transaction.atomic():
+        if lock_team_member(user) == Student.STUDENT_STATUS_ASSIGNED:
+            raise UserAssignedToProject
+
+        TeamProjectPreference.objects.filter(team_id=user.team_id).delete()
+        TeamProjectPreference.objects.bulk_create([TeamProjectPreference(team_id=user.team_id, project=project,
+                                                                         rank=rank)
+                                                   for rank, project in enumerate(projects, 1)])
 
+
+@traced_service
 def user_team_join_project(user, project):
     if not isinstance(user, Student):
         raise MustBeStudent
@@ -120,16 +202,23 @@ def user_team_join_project(user, project):
     if not user.team:
         raise UserNotInTeam
 
-    if Project.objects.filter(all_teams__pk__exact=user.team.pk).exists():
+    if user.team.applied_project_id is not None:
         raise TeamAlreadyInProjectQueue
 
-    if project.assigned_team:
+    if project.assigned_team_id:
         raise ProjectHasAssignedTeam
 
-    project.all_teams.add(user.team)
-    project.save(force_update=True)
+    with transaction.atomic():
+        lock_team_member(user)
+
+        # Only a team without a project is updated.
+        if not Team.objects.filter(pk=user.team_id, applied_project__isnull=True).update(applied_project=project):
+            raise TeamAlreadyInProjectQueue
+        project.all_teams.add(user.team_id)
+    user.team.applied_project = project
 
 
+@traced_service
 def user_team_leave_project(user, project):
     if not isinstance(user, Student):
         raise MustBeStudent
@@ -137,16 +226,22 @@ def user_team_leave_project(user, project):
     if not user.team:
         raise UserNotInTeam
 
-    if not project.all_teams.filter(pk=user.team.pk).exists():
+    if user.team.applied_project_id != project.pk:
         raise TeamNotInProjectQueue
 
-    if project.assigned_team:
+    if project.assigned_team_id:
         raise ProjectHasAssignedTeam
 
-    project.all_teams.remove(user.team)
-    project.save(force_update=True)
+    with transaction.atomic():
+        lock_team_member(user)
+
+        if not Team.objects.filter(pk=user.team_id, applied_project=project).update(applied_project=None):
+            raise TeamNotInProjectQueue
+        project.all_teams.remove(user.team_id)
+    user.team.applied_project = None
 
 
+@traced_service
 def user_delete_project(user, project):
     if not isinstance(user, Teacher):
         raise MustBeTeacher
@@ -160,16 +255,11 @@ def user_delete_project(user, project):
     project.delete()
 
 
+@traced_service
 def user_create_project(user, project_name, project_description):
     if not isinstance(user, Teacher):
         raise MustBeTeacher
 
-    try:
-        if Project.objects.get(name__iexact=project_name):
-            raise ProjectWithGivenNameAlreadyExists
-    except Project.DoesNotExist:
-        pass
-
     project = Project()
     project.name = project_name
     project.description = project_description
@@ -177,63 +267,66 @@ def user_create_project(user, project_name, project_description):
     project.assigned_team = None
     project.author = user
 
-    project.save()
+    try:
+        with transaction.atomic():
+            project.save()
+    except IntegrityError:
+        raise ProjectWithGivenNameAlreadyExists
 
     return project
 
 
+@traced_service
 def user_edit_project(user, project_id, project_name, project_description):
     project = Project.objects.get(pk=project_id)
 
     if project.author != user:
         raise MustBeAuthor
 
-    if Project.objects.exclude(pk=project_id).filter(name__iexact=project_name).exists():
-        raise ProjectWithGivenNameAlreadyExists
-
     project.name = project_name
     project.description = project_description
 
-    project.save(force_update=True)
+    try:
+        with transaction.atomic():
+            project.save(force_update=True)
+    except IntegrityError:
+        raise ProjectWithGivenNameAlreadyExists
 
     return project
 
 
+def exists_case_insensitive(queryset, field_name, value):
+    return queryset.annotate(lower_value=Lower(field_name)).filter(lower_value=value.lower()).exists()
+
+
 def validate_common_create_user_rules(username, email):
-    try:
-        if UserBase.objects.get(username__iexact=username):
-            raise UserWithGivenUsernameAlreadyExists
-    except UserBase.DoesNotExist:
-        pass
+    if exists_case_insensitive(UserBase.objects, 'username', username):
+        raise UserWithGivenUsernameAlreadyExists
 
-    try:
-        if UserBase.objects.get(email__iexact=email):
-            raise UserWithGivenEmailAlreadyExists
-    except UserBase.DoesNotExist:
-        pass
+    if email and exists_case_insensitive(UserBase.objects, 'email', email):
+        raise UserWithGivenEmailAlreadyExists
 
     return True
 
 
+@traced_service
 def account_create_teacher(username, email, password):
-    validate_common_create_user_rules(username, email)
     teacher = Teacher()
     teacher.is_staff = True
     teacher.username = username
     teacher.email = email
     teacher.set_password(password)
 
-    teacher.save()
+    try:
+        with transaction.atomic():
+            teacher.save()
+    except IntegrityError:
+        validate_common_create_user_rules(username, email)
+        raise
 
 
+@traced_service
 def account_create_student(student_no, username, email, password):
-    validate_common_create_user_rules(username, email)
-    try:
-        if Student.objects.get(student_no=student_no):
-            raise StudentWithGivenStudentNoAlreadyExists
-    except UserBase.DoesNotExist:
-        pass
-
     student = Student()
     student.is_staff = False
     student.student_no = student_no
@@ -242,9 +335,17 @@ def account_create_student(student_no, username, email, password):
     student.email = email
     student.set_password(password)
 
-    student.save()
+    try:
+        with transaction.atomic():
+            student.save()
+    except IntegrityError:
+        validate_common_create_user_rules(username, email)
+        if Student.objects.filter(student_no=student_no).exists():
+            raise StudentWithGivenStudentNoAlreadyExists
+        raise
 
 
+@traced_service
 def user_change_password(user, current_password, new_password):
     if user.check_password(current_password) is False:
         raise InvalidPassword
@@ -253,19 +354,24 @@ def user_change_password(user, current_password, new_password):
     user.save(force_update=True)
 
 
+@traced_service
 def user_change_email(user, new_email):
-    try:
-        if UserBase.objects.get(email__iexact=new_email):
-            raise UserWithGivenEmailAlreadyExists
-    except UserBase.DoesNotExist:
-        pass
+    if user.email.lower() == new_email.lower():
+        raise UserWithGivenEmailAlreadyExists
 
+    current_email = user.email
     user.email = new_email
-    user.save(force_update=True)
+    try:
+        with transaction.atomic():
+            user.save(force_update=True)
+    except IntegrityError:
+        user.email = current_email
+        raise UserWithGivenEmailAlreadyExists
 
 
+@traced_service
 def user_delete_account(user):
-    if user.team:
+    if isinstance(user, Student) and user.team:
         raise UserAlreadyInTeam
 
     user.delete()
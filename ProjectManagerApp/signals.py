@@ -0,0 +1,49 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+
+from ProjectManagerApp.models import Team, Project, UserBase, Student, Teacher
+from ProjectManagerApp.service.CounterCache import invalidate_count
+from ProjectManagerApp.service.RequestTrace import trace_connection
+from ProjectManagerApp.service.UserCache import invalidate_users
+
+# Sent after users were updated in bulk, bypassing their post_save signals
+users_updated = Signal(providing_args=['user_ids'])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Project)
+def invalidate_count_on_create(sender, created, **kwargs):
+    if created:
+        invalidate_count(sender)
+
+
+@receiver(post_delete, sender=Team)
+@receiver(post_delete, sender=Project)
+def invalidate_count_on_delete(sender, **kwargs):
+    invalidate_count(sender)
+
+
+@receiver(post_save, sender=UserBase)
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=UserBase)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Teacher)
+def invalidate_user_on_change(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+@receiver(post_delete, sender=Team)
+def invalidate_teammates_on_team_delete(sender, instance, **kwargs):
+    invalidate_users([instance.first_teammate_id, instance.second_teammate_id])
+
+
+@receiver(users_updated)
+def invalidate_users_on_update(sender, user_ids, **kwargs):
+    invalidate_users(user_ids)
+
+
+@receiver(connection_created)
+def trace_connection_on_create(sender, connection, **kwargs):
+    trace_connection(connection)
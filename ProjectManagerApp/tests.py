@@ -1,9 +1,36 @@
-from django.test import TestCase
+import json
+import os
+import pstats
+import subprocess
+import tempfile
+import sys
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
 
 from .services import *
 from django.core.urlresolvers import reverse
 from django.db import IntegrityError
 from .forms import AccountCreateForm, AccountChangePasswordForm, AccountChangeEmailForm
+from . import context_processors
+from .middleware import RequestProfilerMiddleware
+from .service.AuthenticationBackend import AuthenticationBackend
+from .service.UserState import UserState, get_user_state
+from .service.UserCache import get_user_cache, reset_user_caches, LocalUserCache
+from .service.RequestTrace import start_trace, finish_trace, get_current_trace
+from .service.SlowQueryLog import get_slow_query_buffer, reset_slow_query_buffer
+from .service.RequestMetrics import MetricsRegistry, get_metrics_registry, reset_metrics, collect_metrics
+from .urls import urlpatterns
+from .management.commands.stress_teams import check_invariants
 
 
 # SERVICES TESTS
@@ -47,6 +74,9 @@ class CreateUsersServicesTests(TestCase):
         with self.assertRaisesMessage(UserWithGivenUsernameAlreadyExists, ""):
             account_create_teacher("test_student_username", "test3@mail.com", "test_pass")
 
+        with self.assertRaisesMessage(UserWithGivenUsernameAlreadyExists, ""):
+            account_create_teacher("Test_Student_Username", "test3@mail.com", "test_pass")
+
     def test_create_user_with_the_same_email(self):
         account_create_student("1234", "test_student_username", "test1@mail.com", "test_pass")
         account_create_teacher("test_teacher_username", "test2@mail.com", "test_pass")
@@ -63,6 +93,9 @@ class CreateUsersServicesTests(TestCase):
         with self.assertRaisesMessage(UserWithGivenEmailAlreadyExists, ""):
             account_create_teacher("test_student_username1", "test2@mail.com", "test_pass")
 
+        with self.assertRaisesMessage(UserWithGivenEmailAlreadyExists, ""):
+            account_create_teacher("test_student_username1", "TEST2@mail.com", "test_pass")
+
 
 class ManageUsersServicesTests(TestCase):
 
@@ -119,6 +152,10 @@ class ManageUsersServicesTests(TestCase):
         with self.assertRaisesMessage(UserWithGivenEmailAlreadyExists, ""):
             user_change_email(teacher, "student@mail.com")
 
+        with self.assertRaisesMessage(UserWithGivenEmailAlreadyExists, ""):
+            user_change_email(teacher, "Student@Mail.com")
+        self.assertEqual(teacher.email, "teacher@mail.com")
+
     def test_user_delete(self):
         student = Student.objects.get(username='student_username')
         user_delete_account(student)
@@ -254,7 +291,7 @@ class ManageTeamsServicesTests(TestCase):
 
     def test_create_team_as_user_already_in_another_team(self):
         user = Student()
-        team = Team()
+        team = Team(pk=1)
         user.team = team
         team_name = "test_team_name"
 
@@ -299,16 +336,16 @@ class ManageTeamsServicesTests(TestCase):
 
     def test_add_student_with_team_to_another_team(self):
         user = Student()
-        team1 = Team()
-        team2 = Team()
+        team1 = Team(pk=1)
+        team2 = Team(pk=2)
         user.team = team1
 
         with self.assertRaisesMessage(UserAlreadyInTeam, ""):
             user_join_team(user, team2)
 
     def test_add_student_to_full_team(self):
-        user1 = Student()
-        user2 = Student()
+        user1 = Student(pk=1)
+        user2 = Student(pk=2)
         user3 = Student()
         team = Team()
         team.first_teammate = user1
@@ -317,6 +354,25 @@ class ManageTeamsServicesTests(TestCase):
         with self.assertRaisesMessage(TeamIsFull, ""):
             user_join_team(user3, team)
 
+    def test_join_and_leave_team_lock_team_then_student(self):
+        user = Student.objects.get(username='test_username')
+        user2 = Student.objects.get(username='test_username2')
+        team = user_create_team(user, "test_team")
+
+        for service, args in ((user_join_team, (user2, team)), (user_team_leave, (user2,))):
+            with CaptureQueriesContext(connection) as context:
+                service(*args)
+            queries = [query['sql'] for query in context.captured_queries if not query['sql'].startswith(
+                ('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+            self.assertIn('FROM "ProjectManagerApp_team"', queries[0])
+            self.assertIn('FROM "ProjectManagerApp_student"', queries[1])
+            self.assertTrue(all(query.startswith('UPDATE') for query in queries[2:]))
+            # SQLite has no row locks, Django leaves FOR UPDATE out there.
+            if connection.features.has_select_for_update:
+                self.assertIn(connection.ops.for_update_sql(), queries[0])
+                self.assertIn(connection.ops.for_update_sql(), queries[1])
+
 
 class ManageProjectsServicesTests(TestCase):
 
@@ -417,6 +473,7 @@ class ManageProjectsServicesTests(TestCase):
         self.assertTrue(Project.objects.filter(name=self.project_name).exists())
         project.refresh_from_db()
         self.assertTrue(project.all_teams.filter(name=user2.team.name).exists())
+        self.assertEqual(Team.objects.get(name="test_team").applied_project_id, project.pk)
 
     def test_join_project_as_a_teacher(self):
         user = Teacher()
@@ -508,6 +565,11 @@ class ManageProjectsServicesTests(TestCase):
         user_team_leave_project(user2, project)
         project.refresh_from_db()
         self.assertFalse(project.all_teams.filter(name=user2.team.name).exists())
+        self.assertIsNone(Team.objects.get(name="test_team").applied_project_id)
+
+        user_team_join_project(user2, project)
+        project.delete()
+        self.assertIsNone(Team.objects.get(name="test_team").applied_project_id)
 
     def test_leave_project_as_a_teacher(self):
         user = Teacher()
@@ -609,6 +671,343 @@ class ManageProjectsServicesTests(TestCase):
         self.assertEqual(project.assigned_team.first_teammate.status, Student.STUDENT_STATUS_ASSIGNED)
         self.assertEqual(project.assigned_team.second_teammate.status, Student.STUDENT_STATUS_ASSIGNED)
 
+    def create_full_team(self, number):
+        student1 = Student(username='first' + repr(number), email='first' + repr(number) + '@mail.com',
+                           student_no=1000 + number)
+        student1.save()
+        student2 = Student(username='second' + repr(number), email='second' + repr(number) + '@mail.com',
+                           student_no=2000 + number)
+        student2.save()
+
+        user_create_team(student1, "test_team" + repr(number))
+        user_join_team(student2, student1.team)
+        return student1
+
+    def test_assign_teams_to_projects(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+
+        projects = [user_create_project(teacher, self.project_name + repr(i), self.project_description)
+                    for i in range(4)]
+
+        students = [self.create_full_team(i) for i in range(4)]
+        user_team_join_project(students[0], projects[0])
+        user_team_join_project(students[1], projects[0])
+        user_team_join_project(students[2], projects[1])
+
+        incomplete_team_student = Student(username='incomplete', email='incomplete@mail.com', student_no=3000)
+        incomplete_team_student.save()
+        user_create_team(incomplete_team_student, "incomplete_team")
+        user_team_join_project(incomplete_team_student, projects[2])
+
+        self.assertEqual(assign_teams_to_projects(teacher).projects_assigned, 2)
+
+        for project in projects:
+            project.refresh_from_db()
+
+        self.assertIn(projects[0].assigned_team_id, [students[0].team_id, students[1].team_id])
+        self.assertEqual(projects[1].assigned_team_id, students[2].team_id)
+        self.assertIsNone(projects[2].assigned_team)
+        self.assertIsNone(projects[3].assigned_team)
+
+        self.assertEqual([project.status for project in projects], [Project.PROJECT_STATUS_CLOSED,
+                                                                     Project.PROJECT_STATUS_CLOSED,
+                                                                     Project.PROJECT_STATUS_OPEN,
+                                                                     Project.PROJECT_STATUS_OPEN])
+        self.assertEqual(projects[0].all_teams.count(), 0)
+        self.assertEqual(projects[1].all_teams.count(), 0)
+        self.assertEqual(projects[2].all_teams.count(), 1)
+        self.assertEqual(dict(Team.objects.filter(applied_project__isnull=False)
+                              .values_list('name', 'applied_project_id')), {'incomplete_team': projects[2].pk})
+
+        assigned_students = Student.objects.filter(status=Student.STUDENT_STATUS_ASSIGNED)
+        self.assertEqual(assigned_students.count(), 4)
+        self.assertEqual(set(assigned_students.values_list('team_id', flat=True)),
+                         {projects[0].assigned_team_id, projects[1].assigned_team_id})
+
+        self.assertEqual(assign_teams_to_projects(teacher).projects_assigned, 0)
+
+    def test_assign_teams_to_projects_query_count(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+
+        for i in range(10):
+            project = user_create_project(teacher, self.project_name + repr(i), self.project_description)
+            user_team_join_project(self.create_full_team(i), project)
+
+        with self.assertNumQueries(6):
+            self.assertEqual(assign_teams_to_projects(teacher).projects_assigned, 10)
+
+    def test_assign_teams_to_projects_dry_run(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+
+        projects = [user_create_project(teacher, self.project_name + repr(i), self.project_description)
+                    for i in range(5)]
+        for i in range(20):
+            user_team_join_project(self.create_full_team(i), projects[i % len(projects)])
+
+        with self.assertNumQueries(1):
+            result = assign_teams_to_projects(teacher, seed=42, dry_run=True)
+
+        self.assertTrue(result.dry_run)
+        self.assertEqual(result.seed, 42)
+        self.assertEqual(result.projects_assigned, 5)
+        self.assertGreaterEqual(result.load_time, 0)
+        self.assertGreaterEqual(result.solve_time, 0)
+        self.assertIsNone(result.write_time)
+        self.assertFalse(Project.objects.filter(assigned_team__isnull=False).exists())
+        self.assertFalse(Student.objects.filter(status=Student.STUDENT_STATUS_ASSIGNED).exists())
+
+        self.assertEqual(assign_teams_to_projects(teacher, seed=42, dry_run=True).assignments, result.assignments)
+
+        result = assign_teams_to_projects(teacher, seed=42)
+
+        self.assertFalse(result.dry_run)
+        self.assertGreaterEqual(result.write_time, 0)
+        self.assertEqual(dict(Project.objects.values_list('pk', 'assigned_team_id')),
+                         {project_id: team[0] for project_id, team in result.assignments.items()})
+
+    def test_assign_teams_to_projects_by_preferences_dry_run(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        student = self.create_full_team(0)
+        user_team_set_project_preferences(student, [project])
+
+        result = assign_teams_to_projects_by_preferences(teacher, dry_run=True)
+
+        self.assertIsNone(result.seed)
+        self.assertEqual(result.projects_assigned, 1)
+        self.assertEqual(result.rank_distribution, {1: 1})
+        project.refresh_from_db()
+        self.assertIsNone(project.assigned_team)
+        self.assertTrue(TeamProjectPreference.objects.exists())
+
+    def test_assign_teams_command(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        student = self.create_full_team(0)
+        user_team_join_project(student, project)
+
+        out = StringIO()
+        call_command('assign_teams', '--dry-run', '--seed', '7', verbosity=2, stdout=out)
+
+        self.assertIn('Seed: 7', out.getvalue())
+        self.assertIn('Projects to assign: 1', out.getvalue())
+        self.assertIn('Write time: not run (dry run)', out.getvalue())
+        self.assertIn(self.project_name + ': ' + student.team.name, out.getvalue())
+        project.refresh_from_db()
+        self.assertIsNone(project.assigned_team)
+
+        out = StringIO()
+        call_command('assign_teams', stdout=out)
+
+        self.assertIn('Projects assigned: 1', out.getvalue())
+        project.refresh_from_db()
+        self.assertEqual(project.assigned_team_id, student.team_id)
+
+    def test_join_and_leave_project_as_stale_user(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        student = self.create_full_team(0)
+        team = student.team
+        stale_student = Student.objects.select_related('team').get(pk=student.pk)
+
+        user_team_leave(student)
+
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_join_project(stale_student, project)
+        team.refresh_from_db()
+        self.assertIsNone(team.applied_project_id)
+        self.assertFalse(project.all_teams.exists())
+
+        teammate = Student.objects.select_related('team').get(pk=team.first_teammate_id)
+        user_team_join_project(teammate, project)
+        stale_teammate = Student.objects.select_related('team').get(pk=teammate.pk)
+        user_team_leave(teammate)
+
+        # The team was deleted with its last member.
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_leave_project(stale_teammate, project)
+
+        user_create_team(student, "test_team_alone")
+        stale_student = Student.objects.select_related('team').get(pk=student.pk)
+        user_team_leave(student)
+
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_join_project(stale_student, project)
+
+    def test_set_project_preferences(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        projects = [user_create_project(teacher, self.project_name + repr(i), self.project_description)
+                    for i in range(7)]
+        student = self.create_full_team(0)
+
+        user_team_set_project_preferences(student, [projects[2], projects[0]])
+        user_team_set_project_preferences(student, [projects[1], projects[2], projects[3]])
+
+        self.assertEqual(list(TeamProjectPreference.objects.filter(team=student.team).order_by('rank')
+                              .values_list('project_id', 'rank')),
+                         [(projects[1].id, 1), (projects[2].id, 2), (projects[3].id, 3)])
+
+        with self.assertRaisesMessage(TooManyProjectPreferences, ""):
+            user_team_set_project_preferences(student, projects[0:6])
+
+        with self.assertRaisesMessage(DuplicateProjectPreference, ""):
+            user_team_set_project_preferences(student, [projects[0], projects[1], projects[0]])
+
+        with self.assertRaisesMessage(MustBeStudent, ""):
+            user_team_set_project_preferences(teacher, [projects[0]])
+
+        student_without_team = Student(username='no_team', email='no_team@mail.com', student_no=3000)
+        student_without_team.save()
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_set_project_preferences(student_without_team, [projects[0]])
+
+    def test_set_project_preferences_locks_team(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        student = self.create_full_team(0)
+
+        with CaptureQueriesContext(connection) as context:
+            user_team_set_project_preferences(student, [project])
+        queries = [query['sql'] for query in context.captured_queries if not query['sql'].startswith(
+            ('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+        self.assertIn('FROM "ProjectManagerApp_team"', queries[0])
+        self.assertIn('FROM "ProjectManagerApp_student"', queries[1])
+        # SQLite has no row locks, Django leaves FOR UPDATE out there.
+        if connection.features.has_select_for_update:
+            self.assertIn(connection.ops.for_update_sql(), queries[0])
+            self.assertIn(connection.ops.for_update_sql(), queries[1])
+        self.assertTrue(queries[2].startswith('DELETE'))
+
+        # The student left the team, which keeps its ranking.
+        stale_student = Student.objects.select_related('team').get(pk=student.pk)
+        user_team_leave(student)
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_set_project_preferences(stale_student, [])
+        self.assertEqual(list(TeamProjectPreference.objects.values_list('project_id', flat=True)), [project.id])
+
+        # The last teammate left and deleted the team in the meantime.
+        teammate = Student.objects.get(team_id=stale_student.team_id)
+        stale_teammate = Student.objects.get(pk=teammate.pk)
+        user_team_leave(teammate)
+        with self.assertRaisesMessage(UserNotInTeam, ""):
+            user_team_set_project_preferences(stale_teammate, [project])
+
+    def test_set_project_preferences_assigned_meanwhile(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        student = self.create_full_team(0)
+        Student.objects.filter(team_id=student.team_id).update(status=Student.STUDENT_STATUS_ASSIGNED)
+
+        with self.assertRaisesMessage(UserAssignedToProject, ""):
+            user_team_set_project_preferences(student, [project])
+        self.assertFalse(TeamProjectPreference.objects.exists())
+
+    def test_set_project_preferences_project_assigned(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        project = user_create_project(teacher, self.project_name, self.project_description)
+        project2 = user_create_project(teacher, self.project_name + '2', self.project_description)
+
+        student = self.create_full_team(0)
+        user_team_join_project(student, project)
+        assign_teams_to_projects(teacher)
+        project.refresh_from_db()
+
+        with self.assertRaisesMessage(ProjectHasAssignedTeam, ""):
+            user_team_set_project_preferences(self.create_full_team(1), [project2, project])
+
+        student.refresh_from_db()
+        with self.assertRaisesMessage(UserAssignedToProject, ""):
+            user_team_set_project_preferences(student, [project2])
+
+    def test_assign_teams_to_projects_by_preferences(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        projects = [user_create_project(teacher, self.project_name + repr(i), self.project_description)
+                    for i in range(4)]
+
+        students = [self.create_full_team(i) for i in range(3)]
+        user_team_set_project_preferences(students[0], [projects[0], projects[1]])
+        user_team_set_project_preferences(students[1], [projects[0]])
+        user_team_set_project_preferences(students[2], [projects[1], projects[2]])
+
+        incomplete_team_student = Student(username='incomplete', email='incomplete@mail.com', student_no=3000)
+        incomplete_team_student.save()
+        user_create_team(incomplete_team_student, "incomplete_team")
+        user_team_set_project_preferences(incomplete_team_student, [projects[3]])
+
+        with self.assertRaisesMessage(MustBeTeacher, ""):
+            assign_teams_to_projects_by_preferences(students[0])
+
+        result = assign_teams_to_projects_by_preferences(teacher)
+
+        self.assertEqual(result.projects_assigned, 3)
+        self.assertEqual(result.rank_distribution, {1: 1, 2: 2})
+        self.assertGreaterEqual(result.solve_time, 0)
+
+        for project in projects:
+            project.refresh_from_db()
+        self.assertEqual([project.assigned_team_id for project in projects],
+                         [students[1].team_id, students[0].team_id, students[2].team_id, None])
+        self.assertEqual([project.status for project in projects], [Project.PROJECT_STATUS_CLOSED,
+                                                                     Project.PROJECT_STATUS_CLOSED,
+                                                                     Project.PROJECT_STATUS_CLOSED,
+                                                                     Project.PROJECT_STATUS_OPEN])
+
+        self.assertEqual(Student.objects.filter(status=Student.STUDENT_STATUS_ASSIGNED).count(), 6)
+        self.assertEqual(list(TeamProjectPreference.objects.values_list('team_id', flat=True)),
+                         [incomplete_team_student.team_id])
+
+        result = assign_teams_to_projects_by_preferences(teacher)
+        self.assertEqual(result.projects_assigned, 0)
+        self.assertEqual(result.rank_distribution, {})
+
+    def test_assign_teams_to_projects_by_preferences_removes_team_from_other_queue(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        projects = [user_create_project(teacher, self.project_name + repr(i), self.project_description)
+                    for i in range(3)]
+
+        students = [self.create_full_team(i) for i in range(2)]
+        user_team_join_project(students[0], projects[1])
+        user_team_set_project_preferences(students[0], [projects[0]])
+        user_team_join_project(students[1], projects[2])
+
+        self.assertEqual(assign_teams_to_projects_by_preferences(teacher).projects_assigned, 1)
+
+        projects[0].refresh_from_db()
+        self.assertEqual(projects[0].assigned_team_id, students[0].team_id)
+        self.assertEqual(list(Project.all_teams.through.objects.values_list('team_id', 'project_id')),
+                         [(students[1].team_id, projects[2].pk)])
+        self.assertEqual(dict(Team.objects.filter(applied_project__isnull=False)
+                              .values_list('pk', 'applied_project_id')), {students[1].team_id: projects[2].pk})
+
+        student = Student.objects.get(pk=students[0].pk)
+        state = UserState(student)
+        self.assertEqual(state.assigned_project, projects[0])
+        self.assertFalse(state.applied_project)
+        with self.assertRaisesMessage(TeamNotInProjectQueue, ""):
+            user_team_leave_project(student, projects[1])
+
+    def test_ranked_matching_maximizes_assigned_teams_then_minimizes_ranks(self):
+        from .service.RankedMatching import solve_ranked_matching
+
+        team_ids, project_ids, ranks = solve_ranked_matching([1, 1, 2, 3, 3, 3], [10, 20, 10, 20, 30, 10],
+                                                             [1, 2, 1, 1, 2, 3])
+
+        self.assertEqual(sorted(zip(team_ids.tolist(), project_ids.tolist(), ranks.tolist())),
+                         [(1, 20, 2), (2, 10, 1), (3, 30, 2)])
+
     def test_user_edit_project(self):
         teach = Teacher(username='teacher_username', email="teacher@mail.com")
         teach.set_password('teacher_password')
@@ -1826,6 +2225,128 @@ class ViewsTests(TestCase):
         self.assertEqual(len(messages), 1)
         self.assertEqual(str(messages[0]), 'Project with given name already exists.')
 
+    # project preferences
+    def test_project_preferences_from_view(self):
+        teacher = Teacher.objects.get(username="teacher_username")
+        student = Student.objects.get(username="student_username")
+        project = user_create_project(teacher, "test_project", "test_project_description")
+        project2 = user_create_project(teacher, "test_project2", "test_project_description2")
+        user_create_team(student, "test_team")
+
+        self.client.login(username="student_username", password="student_password")
+        response = self.client.get(reverse('project_preferences_url'))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(reverse('project_preferences_url'), {'rank_1': project2.id, 'rank_2': project.id},
+                                    follow=True)
+
+        self.assertRedirects(response, reverse('projects_list_url'))
+        messages = list(response.context['messages'])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(str(messages[0]), 'Project preferences saved.')
+        self.assertEqual(list(TeamProjectPreference.objects.order_by('rank').values_list('project_id', flat=True)),
+                         [project2.id, project.id])
+
+        response = self.client.get(reverse('project_preferences_url'))
+        self.assertEqual(response.context['project_preferences_form'].initial, {'rank_1': project2.id,
+                                                                                'rank_2': project.id})
+
+    def test_project_preferences_from_view_duplicate_project(self):
+        teacher = Teacher.objects.get(username="teacher_username")
+        student = Student.objects.get(username="student_username")
+        project = user_create_project(teacher, "test_project", "test_project_description")
+        user_create_team(student, "test_team")
+
+        self.client.login(username="student_username", password="student_password")
+        response = self.client.post(reverse('project_preferences_url'), {'rank_1': project.id, 'rank_2': project.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TeamProjectPreference.objects.exists())
+
+    def test_project_preferences_from_view_as_teacher(self):
+        self.client.login(username="teacher_username", password="teacher_password")
+
+        response = self.client.get(reverse('project_preferences_url'), follow=True)
+
+        self.assertRedirects(response, reverse('index_url'))
+
+    def test_team_assign_by_preferences_from_view(self):
+        teacher = Teacher.objects.get(username="teacher_username")
+        student = Student.objects.get(username="student_username")
+        project = user_create_project(teacher, "test_project", "test_project_description")
+
+        student2 = Student(username='student2_username', email="student2@mail.com", student_no=1234)
+        student2.save()
+        user_create_team(student, "test_team")
+        user_join_team(student2, student.team)
+        user_team_set_project_preferences(student, [project])
+
+        self.client.login(username="teacher_username", password="teacher_password")
+        response = self.client.post(reverse('team_assign_url'), {'mode': 'preferences'}, follow=True)
+
+        self.assertRedirects(response, reverse('projects_list_url'))
+        messages = list(response.context['messages'])
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(str(messages[0]).startswith('Assigning completed. Assigned teams to 1 projects in '))
+        self.assertTrue(str(messages[0]).endswith(' s. Assigned teams by preference rank: 1: 1.'))
+
+        project.refresh_from_db()
+        self.assertEqual(project.assigned_team_id, student.team_id)
+
+    def test_team_create_with_message_does_not_write_session(self):
+        self.client.login(username="student_username", password="student_password")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('team_create_url'), {'name': 'test_team'}, follow=True)
+
+        messages = list(response.context['messages'])
+        self.assertEqual(len(messages), 1)
+        self.assertFalse([query['sql'] for query in queries.captured_queries if 'django_session' in query['sql']
+                          and not query['sql'].startswith('SELECT')])
+
+    def test_team_assign_preview(self):
+        teacher = Teacher.objects.get(username="teacher_username")
+        student = Student.objects.get(username="student_username")
+        project = user_create_project(teacher, "test_project", "test_project_description")
+
+        student2 = Student(username='student2_username', email="student2@mail.com", student_no=1234)
+        student2.save()
+        user_create_team(student, "test_team")
+        user_join_team(student2, student.team)
+        user_team_join_project(student, project)
+
+        self.client.login(username="teacher_username", password="teacher_password")
+        response = self.client.get(reverse('team_assign_preview_url'), {'seed': 3})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].seed, 3)
+        self.assertEqual(response.context['assignments'], [(project, student.team)])
+        project.refresh_from_db()
+        self.assertIsNone(project.assigned_team)
+
+        response = self.client.post(reverse('team_assign_url'), {'seed': 3}, follow=True)
+
+        self.assertRedirects(response, reverse('projects_list_url'))
+        project.refresh_from_db()
+        self.assertEqual(project.assigned_team_id, student.team_id)
+
+    def test_team_assign_preview_invalid_seed(self):
+        self.client.login(username="teacher_username", password="teacher_password")
+
+        response = self.client.get(reverse('team_assign_preview_url'), {'seed': 'abc'}, follow=True)
+
+        self.assertRedirects(response, reverse('index_url'))
+        messages = list(response.context['messages'])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(str(messages[0]), 'Invalid seed.')
+
+    def test_team_assign_preview_as_student(self):
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('team_assign_preview_url'), follow=True)
+
+        self.assertRedirects(response, reverse('index_url'))
+
     # test wrong path
     def test_error_view(self):
         response = self.client.get('/wrong_path/')
@@ -1834,6 +2355,412 @@ class ViewsTests(TestCase):
         self.assertTemplateUsed(response, 'http_error.html')
 
 
+# MANAGEMENT COMMANDS TESTS
+
+class BenchmarkSessionWritesCommandTests(TestCase):
+
+    def test_benchmark_session_writes_command(self):
+        out = StringIO()
+        call_command('benchmark_session_writes', stdout=out)
+
+        totals = [line.split() for line in out.getvalue().splitlines() if line.strip().startswith('total')]
+        session_writes = [int(total[total.index('session') + 2]) for total in totals]
+        self.assertEqual(len(session_writes), 4)
+        self.assertGreater(session_writes[0], 0)
+        self.assertEqual(session_writes[1:], [0, 0, 0])
+
+
+class PurgeSessionsCommandTests(TestCase):
+
+    def test_purge_sessions_command(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key='expired' + repr(i), session_data='', expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key='valid', session_data='', expire_date=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, sleep=0, stdout=out)
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['valid'])
+        self.assertEqual(out.getvalue().count('expired sessions in'), 4)
+        self.assertIn('Done. Deleted 5 expired sessions', out.getvalue())
+
+
+class SeedDataCommandTests(TestCase):
+
+    def test_seed_data_command(self):
+        out = StringIO()
+        call_command('seed_data', students=9, teams=4, projects=3, teachers=2, queue_length=2, seed=1, stdout=out)
+
+        self.assertIn('Students: 9', out.getvalue())
+        students = Student.objects.filter(username__startswith='seed_student_')
+        self.assertEqual(students.count(), 9)
+        self.assertEqual(students.filter(team__isnull=True).count(), 1)
+        for team in Team.objects.filter(name__startswith='seed_team_'):
+            self.assertEqual(team.first_teammate.team_id, team.id)
+            self.assertEqual(team.second_teammate.team_id, team.id)
+        self.assertEqual(Teacher.objects.filter(username__startswith='seed_teacher_').count(), 2)
+        self.assertEqual(Project.objects.filter(name__startswith='seed_project_').count(), 3)
+        self.assertEqual(check_invariants('seed'), [])
+        for team_id, project_id in Project.all_teams.through.objects.values_list('team_id', 'project_id'):
+            self.assertEqual(TeamProjectPreference.objects.get(team_id=team_id, rank=1).project_id, project_id)
+        self.assertTrue(self.client.login(username='seed_student_0', password='password'))
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', students=1, stdout=StringIO())
+
+
+class BenchmarkViewsCommandTests(TestCase):
+
+    def test_benchmark_views_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_views', scales='20', repeat=2, output=path, stderr=StringIO())
+            with open(path) as results_file:
+                results = json.load(results_file)['results']
+
+            for result in results:
+                result['queries'] -= 1
+            with open(path, 'w') as results_file:
+                json.dump({'results': results}, results_file)
+
+            with self.assertRaisesRegex(CommandError, 'benchmarks regressed'):
+                call_command('benchmark_views', scales='20', repeat=1, baseline=path, stdout=StringIO(),
+                             stderr=StringIO())
+
+        names = {(result['name'], result['role']) for result in results}
+        self.assertIn(('projects_list_url', 'student'), names)
+        self.assertIn(('team_assign_url', 'teacher'), names)
+        self.assertIn(('assign_teams_to_projects', 'teacher'), names)
+        for result in results:
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertFalse(Student.objects.filter(username__startswith='benchmark_').exists())
+
+
+class BenchmarkAssignmentCommandTests(TestCase):
+
+    def test_benchmark_assignment_command(self):
+        out = StringIO()
+        call_command('benchmark_assignment', projects='10,40', queue_depths='2', repeat=1, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertIn('Mode lottery, queue depth 2, 5.00 teams per project', lines)
+        self.assertEqual([line.split()[0] for line in lines[2:4]], ['10', '40'])
+        self.assertEqual(lines[4].split()[0], 'exponent')
+        self.assertEqual(len(lines[4].split()), 6)
+        self.assertFalse(Project.objects.exists())
+
+        with self.assertRaisesRegex(CommandError, 'queries with queue depth 2'):
+            call_command('benchmark_assignment', projects='10,40', queue_depths='2', repeat=1, max_query_exponent=-1,
+                         stdout=StringIO())
+
+
+# QUERY COUNT TESTS
+
+class QueryCountTests(TestCase):
+    # Queries allowed per request as (student, teacher), including the session and user lookups and the savepoints of
+    # the rolled back test requests. The budgets do not grow with the data, so a view running a query per listed
+    # object fails them.
+    QUERY_BUDGETS = {
+        'index_url': (8, 6),
+        'account_login_url': (4, 4),
+        'account_logout_url': (6, 6),
+        'account_create_url': (4, 4),
+        'account_details_url': (4, 4),
+        'account_delete_url': (5, 17),
+        'account_change_email_url': (4, 4),
+        'account_change_password_url': (4, 4),
+        'projects_list_url': (7, 6),
+        'project_create_url': (4, 4),
+        'project_join_url': (8, 4),
+        'project_leave_url': (12, 4),
+        'project_preferences_url': (10, 4),
+        'project_delete_url': (4, 10),
+        'project_details_url': (6, 6),
+        'project_edit_url': (4, 5),
+        'teams_list_url': (6, 5),
+        'team_create_url': (4, 4),
+        'team_assign_url': (4, 10),
+        'team_assign_preview_url': (4, 7),
+        'team_join_url': (6, 4),
+        'team_leave_url': (15, 4),
+        'team_details_url': (5, 5),
+        'metrics_url': (4, 4),
+        'slow_queries_url': (4, 4),
+        'error_404_url': (4, 4),
+    }
+
+    def setUp(self):
+        self.teacher = Teacher(username='teacher_username', email="teacher@mail.com")
+        self.teacher.set_password('teacher_password')
+        self.teacher.save()
+
+        self.student = Student(username='student_username', email="student@mail.com", student_no=1)
+        self.student.set_password('student_password')
+        self.student.save()
+
+        user_create_team(self.student, "student_team")
+        self.seeded = 0
+
+    def seed(self, count):
+        for i in range(self.seeded, self.seeded + count):
+            project = user_create_project(self.teacher, "project" + repr(i), "description")
+
+            first = Student(username='first' + repr(i), email='first' + repr(i) + '@mail.com', student_no=1000 + i)
+            first.save()
+            second = Student(username='second' + repr(i), email='second' + repr(i) + '@mail.com', student_no=5000 + i)
+            second.save()
+
+            user_create_team(first, "team" + repr(i))
+            user_join_team(second, first.team)
+            user_team_join_project(first, project)
+
+            if i % 2:
+                assign_team_to_project(project)
+        self.seeded += count
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueryCountConstant(self, username, password, url):
+        self.client.login(username=username, password=password)
+
+        self.seed(2)
+        queries = self.count_queries(url)
+
+        self.seed(8)
+        self.assertEqual(self.count_queries(url), queries)
+
+    def test_project_list_as_student(self):
+        user_team_join_project(self.student, user_create_project(self.teacher, "student_project", "description"))
+        self.assertQueryCountConstant('student_username', 'student_password', reverse('projects_list_url'))
+
+    def test_project_list_as_teacher(self):
+        self.assertQueryCountConstant('teacher_username', 'teacher_password', reverse('projects_list_url'))
+
+    def test_team_list_as_student(self):
+        self.assertQueryCountConstant('student_username', 'student_password', reverse('teams_list_url'))
+
+    def test_team_list_as_teacher(self):
+        self.assertQueryCountConstant('teacher_username', 'teacher_password', reverse('teams_list_url'))
+
+    def test_team_details(self):
+        self.seed(2)
+        team = Project.objects.filter(assigned_team__isnull=False)[0].assigned_team
+        self.client.login(username='teacher_username', password='teacher_password')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('team_details_url', kwargs={'id': team.id}))
+        self.assertContains(response, team.first_teammate.username)
+        self.assertContains(response, team.project.name)
+
+        team_queries = [query for query in context.captured_queries if 'projectmanagerapp_team' in query['sql'].lower()]
+        self.assertEqual(len(team_queries), 1)
+
+    def create_budget_data(self):
+        self.teacher.is_staff = True
+        self.teacher.is_superuser = True
+        self.teacher.save()
+
+        project = user_create_project(self.teacher, "student_project", "description")
+        user_team_join_project(self.student, project)
+        other_project = user_create_project(self.teacher, "other_project", "description")
+        return self.student.team, project, other_project
+
+    def get_requests(self, team, project, other_project):
+        return [
+            ('index_url', 'get', {}, None),
+            ('account_login_url', 'get', {}, None),
+            ('account_logout_url', 'get', {}, None),
+            ('account_create_url', 'get', {}, None),
+            ('account_details_url', 'get', {}, None),
+            ('account_delete_url', 'post', {}, {}),
+            ('account_change_email_url', 'get', {}, None),
+            ('account_change_password_url', 'get', {}, None),
+            ('projects_list_url', 'get', {}, None),
+            ('project_create_url', 'get', {}, None),
+            ('project_join_url', 'post', {}, {'project_id': other_project.id}),
+            ('project_leave_url', 'post', {}, {'project_id': project.id}),
+            ('project_preferences_url', 'get', {}, None),
+            ('project_delete_url', 'post', {}, {'project_id': other_project.id}),
+            ('project_details_url', 'get', {'id': project.id}, None),
+            ('project_edit_url', 'get', {'id': project.id}, None),
+            ('teams_list_url', 'get', {}, None),
+            ('team_create_url', 'get', {}, None),
+            ('team_assign_url', 'post', {}, {}),
+            ('team_assign_preview_url', 'get', {}, None),
+            ('team_join_url', 'post', {}, {'team_id': team.id}),
+            ('team_leave_url', 'post', {}, {}),
+            ('team_details_url', 'get', {'id': team.id}, None),
+            ('metrics_url', 'get', {}, None),
+            ('slow_queries_url', 'get', {}, None),
+            ('error_404_url', 'get', {}, None),
+        ]
+
+    def measure_queries(self, user, requests):
+        queries = {}
+        for name, method, kwargs, data in requests:
+            url = '/missing/' if name == 'error_404_url' else reverse(name, kwargs=kwargs)
+            self.client.force_login(user)
+            reset_metrics()
+            # Every request is rolled back, so that all of them see the same data.
+            with transaction.atomic():
+                response = getattr(self.client, method)(url, data)
+                transaction.set_rollback(True)
+            self.assertLess(response.status_code, 500, name)
+            queries[name] = get_metrics_registry().snapshot()['histograms']['projectmanager_request_sql_queries'][
+                name]['sum']
+        return queries
+
+    def assertQueryBudgets(self, user, role):
+        requests = self.get_requests(*self.create_budget_data())
+
+        self.seed(3)
+        queries = self.measure_queries(user, requests)
+        self.seed(27)
+        self.assertEqual(self.measure_queries(user, requests), queries)
+
+        for name, count in queries.items():
+            self.assertLessEqual(count, self.QUERY_BUDGETS[name][role], name)
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names, set(self.QUERY_BUDGETS))
+        self.assertEqual(names, {name for name, _, _, _ in self.get_requests(*self.create_budget_data())})
+
+    def test_query_budgets_as_student(self):
+        self.assertQueryBudgets(self.student, 0)
+
+    def test_query_budgets_as_teacher(self):
+        self.assertQueryBudgets(self.teacher, 1)
+
+
+# CONCURRENCY TESTS
+
+class StressTeamsCommandTests(TransactionTestCase):
+
+    def test_stress_teams_command(self):
+        out = StringIO()
+        call_command('stress_teams', students=8, teams=2, projects=2, threads=2, operations=10, stdout=out)
+
+        self.assertIn('Operations: 20 in', out.getvalue())
+        self.assertIn('Invariants: OK', out.getvalue())
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(Team.objects.exists())
+
+    def test_check_invariants(self):
+        students = []
+        for i in range(3):
+            student = Student(username='stress_student' + repr(i), student_no=i)
+            student.save()
+            students.append(student)
+        team = user_create_team(students[0], 'stress_team')
+        user_join_team(students[1], team)
+        Student.objects.filter(pk=students[2].pk).update(team=team)
+        Team.objects.create(name='stress_empty_team')
+
+        violations = check_invariants('stress')
+
+        self.assertEqual(len(violations), 3)
+        self.assertIn('Team stress_team has 3 members.', violations)
+        self.assertIn('Team stress_empty_team is empty but was not deleted.', violations)
+
+
+# PAGINATION TESTS
+
+@override_settings(LIST_PAGE_SIZE=2)
+class PaginationTests(TestCase):
+
+    def setUp(self):
+        teacher = Teacher(username='teacher_username', email="teacher@mail.com")
+        teacher.set_password('teacher_password')
+        teacher.save()
+
+        self.projects = [user_create_project(teacher, "test_project" + repr(i), "test_description")
+                         for i in range(5)]
+
+        self.client.login(username="teacher_username", password="teacher_password")
+
+    def get_page(self, **kwargs):
+        response = self.client.get(reverse('projects_list_url'), kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def test_first_page(self):
+        page = self.get_page()
+
+        self.assertEqual(list(page), self.projects[0:2])
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.next_cursor, self.projects[1].pk)
+
+    def test_next_pages(self):
+        page = self.get_page(after=self.projects[1].pk)
+
+        self.assertEqual(list(page), self.projects[2:4])
+        self.assertEqual(page.previous_cursor, self.projects[2].pk)
+        self.assertEqual(page.next_cursor, self.projects[3].pk)
+
+        page = self.get_page(after=page.next_cursor)
+
+        self.assertEqual(list(page), self.projects[4:5])
+        self.assertEqual(page.previous_cursor, self.projects[4].pk)
+        self.assertFalse(page.has_next)
+
+    def test_previous_pages(self):
+        page = self.get_page(before=self.projects[4].pk)
+
+        self.assertEqual(list(page), self.projects[2:4])
+        self.assertEqual(page.previous_cursor, self.projects[2].pk)
+        self.assertEqual(page.next_cursor, self.projects[3].pk)
+
+        page = self.get_page(before=page.previous_cursor)
+
+        self.assertEqual(list(page), self.projects[0:2])
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.next_cursor, self.projects[1].pk)
+
+    def test_invalid_cursor(self):
+        page = self.get_page(after='invalid')
+
+        self.assertEqual(list(page), self.projects[0:2])
+
+    def test_cursor_after_last_row(self):
+        page = self.get_page(after=self.projects[4].pk)
+
+        self.assertEqual(list(page), self.projects[3:5])
+        self.assertEqual(page.previous_cursor, self.projects[3].pk)
+        self.assertFalse(page.has_next)
+
+        self.projects[4].delete()
+        page = self.get_page(after=self.projects[3].pk)
+
+        self.assertEqual(list(page), self.projects[2:4])
+        self.assertFalse(page.has_next)
+
+    def test_cursor_before_first_rows(self):
+        page = self.get_page(before=self.projects[1].pk)
+
+        self.assertEqual(list(page), self.projects[0:2])
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.next_cursor, self.projects[1].pk)
+
+        page = self.get_page(before=self.projects[0].pk)
+
+        self.assertEqual(list(page), self.projects[0:2])
+
+    def test_pager_links(self):
+        response = self.client.get(reverse('teams_list_url'))
+        self.assertNotContains(response, 'class="pager"')
+
+        response = self.client.get(reverse('projects_list_url'), {'after': self.projects[1].pk})
+        self.assertContains(response, '?before=' + repr(self.projects[2].pk))
+        self.assertContains(response, '?after=' + repr(self.projects[3].pk))
+
+
 # MODELS TESTS (db integrity)
 
 class ModelsTests(TestCase):
@@ -1858,6 +2785,677 @@ class ModelsTests(TestCase):
         with self.assertRaises(IntegrityError):
             user.save()
 
+    def test_create_user_with_the_same_username_different_case(self):
+        Student(username='test_username', student_no=1234).save()
+
+        with self.assertRaises(IntegrityError):
+            Teacher(username='TEST_Username').save()
+
+    def test_create_user_with_the_same_email_different_case(self):
+        Student(username='test_username', email='test@mail.com', student_no=1234).save()
+        Student(username='test_username2', student_no=1212).save()
+        Student(username='test_username3', student_no=1313).save()
+
+        with self.assertRaises(IntegrityError):
+            Teacher(username='teacher_username', email='TEST@mail.com').save()
+
+    def test_create_team_with_the_same_name_different_case(self):
+        Team(name='test_team').save()
+
+        with self.assertRaises(IntegrityError):
+            Team(name='Test_Team').save()
+
+    def test_create_project_with_the_same_name_different_case(self):
+        teacher = Teacher(username='teacher_username')
+        teacher.save()
+        Project(name='test_project', author=teacher).save()
+
+        with self.assertRaises(IntegrityError):
+            Project(name='TEST_PROJECT', author=teacher).save()
+
+
+# CONTEXT PROCESSORS TESTS
+
+class ContextProcessorsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        self.teacher = Teacher(username='teacher_username', email="teacher@mail.com")
+        self.teacher.save()
+
+        self.student = Student(username='student_username', email="student@mail.com", student_no=1111)
+        self.student.save()
+
+        for i in range(5):
+            user_create_project(self.teacher, "test_project" + repr(i), "test_description")
+
+    def create_request(self, user):
+        request = RequestFactory().get(reverse('index_url'))
+        request.user = user
+        return request
+
+    def test_student_without_team(self):
+        request = self.create_request(self.student)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(context_processors.is_student(request)['is_student'])
+            self.assertFalse(context_processors.is_teacher(request)['is_teacher'])
+            self.assertFalse(context_processors.has_user_team(request)['has_user_team'])
+            self.assertFalse(context_processors.user_team(request)['user_team'])
+            self.assertFalse(context_processors.user_team_assigned_project(request)['user_team_assigned_project'])
+            self.assertFalse(context_processors.user_team_applied_project(request)['user_team_applied_project'])
+
+    def test_teacher(self):
+        request = self.create_request(self.teacher)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(context_processors.is_student(request)['is_student'])
+            self.assertTrue(context_processors.is_teacher(request)['is_teacher'])
+            self.assertFalse(context_processors.has_user_team(request)['has_user_team'])
+            self.assertFalse(context_processors.user_team(request)['user_team'])
+            self.assertFalse(context_processors.user_team_assigned_project(request)['user_team_assigned_project'])
+            self.assertFalse(context_processors.user_team_applied_project(request)['user_team_applied_project'])
+
+    def test_student_team_applied_project(self):
+        user_create_team(self.student, "test_team")
+        project = Project.objects.get(name="test_project3")
+        user_team_join_project(self.student, project)
+
+        request = self.create_request(Student.objects.get(pk=self.student.pk))
+
+        with self.assertNumQueries(1):
+            self.assertTrue(context_processors.has_user_team(request)['has_user_team'])
+            self.assertFalse(context_processors.user_team_assigned_project(request)['user_team_assigned_project'])
+            self.assertEqual(context_processors.user_team_applied_project(request)['user_team_applied_project'],
+                             project)
+
+    def test_student_team(self):
+        user_create_team(self.student, "test_team")
+
+        request = self.create_request(Student.objects.get(pk=self.student.pk))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(context_processors.user_team(request)['user_team'].name, "test_team")
+            self.assertEqual(context_processors.user_team(request)['user_team'].pk, self.student.team_id)
+
+    def test_student_team_shown_on_index(self):
+        user_create_team(self.student, "test_team")
+        self.student.set_password('student_password')
+        self.student.save()
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('index_url'))
+        self.assertContains(response, reverse('team_details_url', kwargs={'id': self.student.team_id}))
+        self.assertEqual(get_user_state(response.wsgi_request).team.name, "test_team")
+        self.assertEqual(context_processors.get_evaluated_context_processors(response.wsgi_request)['user_team'], 1)
+
+    def test_student_team_assigned_project(self):
+        student2 = Student(username='student2_username', email="student2@mail.com", student_no=1234)
+        student2.save()
+
+        user_create_team(self.student, "test_team")
+        user_join_team(student2, self.student.team)
+        project = Project.objects.get(name="test_project1")
+        user_team_join_project(self.student, project)
+        assign_team_to_project(project)
+
+        request = self.create_request(Student.objects.get(pk=self.student.pk))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(context_processors.user_team_assigned_project(request)['user_team_assigned_project'],
+                             project)
+            self.assertFalse(context_processors.user_team_applied_project(request)['user_team_applied_project'])
+
+    def test_lazy_processors_not_evaluated_when_unused(self):
+        with self.assertNumQueries(0):
+            context = context_processors.projects_count(self.create_request(self.student))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(context['projects_count'], 5)
+            self.assertEqual(context['projects_count'], 5)
+
+    def test_counters_cached(self):
+        self.assertEqual(context_processors.projects_count(self.create_request(self.student))['projects_count'], 5)
+        self.assertEqual(context_processors.teams_count(self.create_request(self.student))['teams_count'], 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(context_processors.projects_count(self.create_request(self.teacher))['projects_count'], 5)
+            self.assertEqual(context_processors.teams_count(self.create_request(self.teacher))['teams_count'], 0)
+
+    def test_counters_invalidated(self):
+        self.assertEqual(context_processors.projects_count(self.create_request(self.student))['projects_count'], 5)
+        self.assertEqual(context_processors.teams_count(self.create_request(self.student))['teams_count'], 0)
+
+        user_create_team(self.student, "test_team")
+        user_delete_project(self.teacher, Project.objects.get(name="test_project0"))
+
+        self.assertEqual(context_processors.projects_count(self.create_request(self.student))['projects_count'], 4)
+        self.assertEqual(context_processors.teams_count(self.create_request(self.student))['teams_count'], 1)
+
+        user_team_leave(self.student)
+
+        self.assertEqual(context_processors.teams_count(self.create_request(self.student))['teams_count'], 0)
+
+    def test_evaluated_context_processors(self):
+        response = self.client.get(reverse('account_login_url'))
+        self.assertEqual(context_processors.get_evaluated_context_processors(response.wsgi_request), {})
+
+        self.student.set_password('student_password')
+        self.student.save()
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('account_details_url'))
+        self.assertEqual(context_processors.get_evaluated_context_processors(response.wsgi_request), {})
+
+        response = self.client.get(reverse('index_url'))
+        self.assertContains(response, '<span class="badge">5</span>')
+        self.assertEqual(context_processors.get_evaluated_context_processors(response.wsgi_request),
+                         {'projects_count': 1, 'teams_count': 1, 'user_team_assigned_project': 1,
+                          'user_team_applied_project': 1})
+
+
+# AUTHENTICATION BACKEND TESTS
+
+class AuthenticationBackendTests(TestCase):
+
+    def setUp(self):
+        self.backend = AuthenticationBackend()
+
+        self.teacher = Teacher(username='teacher_username', email="teacher@mail.com")
+        self.teacher.set_password('teacher_password')
+        self.teacher.save()
+
+        self.student = Student(username='student_username', email="student@mail.com", student_no=1111)
+        self.student.set_password('student_password')
+        self.student.save()
+        user_create_team(self.student, "test_team")
+
+    def test_get_user_student(self):
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.student.pk)
+            self.assertIsInstance(user, Student)
+            self.assertEqual(user.username, 'student_username')
+            self.assertEqual(user.email, 'student@mail.com')
+            self.assertEqual(user.student_no, 1111)
+            self.assertEqual(user.team_id, self.student.team_id)
+
+    def test_get_user_teacher(self):
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.teacher.pk)
+            self.assertIsInstance(user, Teacher)
+            self.assertEqual(user.username, 'teacher_username')
+            self.assertEqual(user.email, 'teacher@mail.com')
+
+    def test_get_user_does_not_exist(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.backend.get_user(self.student.pk + self.teacher.pk))
+
+    def test_authenticate(self):
+        with self.assertNumQueries(1):
+            user = self.backend.authenticate('teacher_username', 'teacher_password')
+            self.assertIsInstance(user, Teacher)
+
+        self.assertIsNone(self.backend.authenticate('teacher_username', 'wrong_password'))
+        self.assertIsNone(self.backend.authenticate('unknown_username', 'teacher_password'))
+
+
+# USER CACHE TESTS
+
+@override_settings(USER_CACHE='local')
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_user_caches()
+        self.backend = AuthenticationBackend()
+
+        self.teacher = Teacher(username='teacher_username', email="teacher@mail.com")
+        self.teacher.set_password('teacher_password')
+        self.teacher.save()
+
+        self.student = Student(username='student_username', email="student@mail.com", student_no=1111)
+        self.student.set_password('student_password')
+        self.student.save()
+
+        self.student2 = Student(username='student2_username', email="student2@mail.com", student_no=2222)
+        self.student2.save()
+
+    def test_get_user_cached(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.backend.get_user(self.student.pk), self.student)
+            user = self.backend.get_user(self.student.pk)
+            self.assertIsInstance(user, Student)
+            self.assertEqual(user.student_no, 1111)
+            self.assertIsInstance(self.backend.get_user(self.teacher.pk), Teacher)
+            self.assertIsInstance(self.backend.get_user(self.teacher.pk), Teacher)
+
+        self.assertEqual(get_user_cache().hits, 2)
+        self.assertEqual(get_user_cache().misses, 2)
+
+    def test_get_user_returns_copies(self):
+        user = self.backend.get_user(self.student.pk)
+        user.email = "changed@mail.com"
+
+        self.assertEqual(self.backend.get_user(self.student.pk).email, "student@mail.com")
+
+    def test_get_user_does_not_exist_not_cached(self):
+        user_id = self.student.pk + self.student2.pk + self.teacher.pk
+
+        self.assertIsNone(self.backend.get_user(user_id))
+        self.assertIsNone(self.backend.get_user(user_id))
+        self.assertEqual(get_user_cache().misses, 2)
+
+    def test_invalidated_on_team_join_and_leave(self):
+        self.backend.get_user(self.student.pk)
+        team = user_create_team(self.student, "test_team")
+        self.assertEqual(self.backend.get_user(self.student.pk).team_id, team.pk)
+
+        self.backend.get_user(self.student2.pk)
+        user_join_team(self.student2, team)
+        self.assertEqual(self.backend.get_user(self.student2.pk).team_id, team.pk)
+
+        user_team_leave(self.student)
+        self.assertIsNone(self.backend.get_user(self.student.pk).team_id)
+
+    def test_invalidated_on_assignment(self):
+        project = user_create_project(self.teacher, "test_project", "test_project_description")
+        team = user_create_team(self.student, "test_team")
+        user_join_team(self.student2, team)
+        user_team_join_project(self.student, project)
+        self.backend.get_user(self.student.pk)
+        self.backend.get_user(self.student2.pk)
+
+        assign_team_to_project(project)
+
+        self.assertEqual(self.backend.get_user(self.student.pk).status, Student.STUDENT_STATUS_ASSIGNED)
+        self.assertEqual(self.backend.get_user(self.student2.pk).status, Student.STUDENT_STATUS_ASSIGNED)
+
+    def test_invalidated_on_change_email_and_password(self):
+        self.backend.get_user(self.student.pk)
+        user_change_email(self.student, "new@mail.com")
+        self.assertEqual(self.backend.get_user(self.student.pk).email, "new@mail.com")
+
+        user_change_password(self.student, 'student_password', 'new_password')
+        self.assertTrue(self.backend.get_user(self.student.pk).check_password('new_password'))
+
+    def test_invalidated_on_delete(self):
+        self.backend.get_user(self.student2.pk)
+        user_delete_account(self.student2)
+
+        self.assertIsNone(self.backend.get_user(self.student2.pk))
+
+    @override_settings(USER_CACHE_SIZE=1)
+    def test_least_recently_used_evicted(self):
+        if not isinstance(get_user_cache(), LocalUserCache):
+            return
+
+        self.backend.get_user(self.student.pk)
+        self.backend.get_user(self.student2.pk)
+
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.student2.pk)
+            self.backend.get_user(self.student.pk)
+
+    @override_settings(USER_CACHE_TIMEOUT=0)
+    def test_expired(self):
+        self.backend.get_user(self.student.pk)
+
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.student.pk)
+
+    def test_authenticated_request(self):
+        self.client.login(username="student_username", password="student_password")
+        self.client.get(reverse('index_url'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.student.pk), self.student)
+
+
+@override_settings(USER_CACHE='shared')
+class SharedUserCacheTests(UserCacheTests):
+    pass
+
+
+# REQUEST METRICS TESTS
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        reset_metrics()
+        account_create_teacher("teacher_username", "teacher@mail.com", "teacher_password")
+        account_create_student(1111, "student_username", "student@mail.com", "student_password")
+        teacher = Teacher.objects.get(username="teacher_username")
+        for i in range(3):
+            user_create_project(teacher, "test_project" + repr(i), "test_description")
+
+    def get_histogram(self, name, view):
+        return get_metrics_registry().snapshot()['histograms'][name][view]
+
+    def test_request_recorded_by_url_name(self):
+        self.client.login(username="student_username", password="student_password")
+
+        self.client.get(reverse('projects_list_url'))
+        self.client.get(reverse('projects_list_url'))
+
+        duration = self.get_histogram('projectmanager_request_duration_seconds', 'projects_list_url')
+        self.assertEqual(sum(duration['buckets']), 2)
+        self.assertGreater(duration['sum'], 0)
+
+        sql_queries = self.get_histogram('projectmanager_request_sql_queries', 'projects_list_url')
+        self.assertGreater(sql_queries['sum'], 0)
+        self.assertGreater(self.get_histogram('projectmanager_request_sql_duration_seconds', 'projects_list_url')['sum'],
+                           0)
+        self.assertGreater(
+            self.get_histogram('projectmanager_request_template_duration_seconds', 'projects_list_url')['sum'], 0)
+
+    def test_trace_counts_queries(self):
+        trace = start_trace()
+        try:
+            list(Project.objects.all())
+            Project.objects.count()
+            with connection.cursor() as cursor:
+                cursor.executemany('UPDATE "ProjectManagerApp_project" SET "status" = %s WHERE "id" = %s',
+                                   [(Project.PROJECT_STATUS_OPEN, 1), (Project.PROJECT_STATUS_OPEN, 2)])
+        finally:
+            finish_trace(trace)
+        Project.objects.count()
+
+        self.assertEqual(trace.sql_count, 3)
+        self.assertGreater(trace.sql_time, 0)
+        self.assertIsNone(get_current_trace())
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('index_url'))
+
+        spans = {}
+        for span in response['Server-Timing'].split(', '):
+            name, duration, description = span.split(';')
+            spans[name] = (float(duration[len('dur='):]), description)
+        self.assertEqual(list(spans), ['auth', 'cp', 'sql', 'tpl', 'handler', 'total'])
+        self.assertGreater(spans['tpl'][0], 0)
+        self.assertGreaterEqual(spans['total'][0], spans['handler'][0])
+        self.assertGreaterEqual(spans['handler'][0], spans['tpl'][0])
+        self.assertEqual(spans['handler'][1], 'desc="View with templates and response middleware"')
+        self.assertRegex(spans['sql'][1], r'^desc="SQL \(\d+ queries\)"$')
+
+    def test_server_timing_header_disabled(self):
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('index_url'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_profile_request(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            self.client.login(username="teacher_username", password="teacher_password")
+
+            response = self.client.get(reverse('projects_list_url'), {'profile': 'tottime'})
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('projects_list_url', response['X-Profile'])
+            self.assertEqual(sorted(os.listdir(directory)), [response['X-Profile'] + '.prof',
+                                                             response['X-Profile'] + '.txt'])
+            with open(os.path.join(directory, response['X-Profile'] + '.txt')) as summary_file:
+                summary = summary_file.read()
+            self.assertIn('Ordered by: internal time', summary)
+            functions = pstats.Stats(os.path.join(directory, response['X-Profile'] + '.prof')).stats
+            self.assertIn(('views.py', 'get'), [(os.path.basename(path), name) for path, _, name in functions])
+
+            response = self.client.get(reverse('teams_list_url'), HTTP_X_PROFILE='')
+
+            self.assertIn('teams_list_url', response['X-Profile'])
+            with open(os.path.join(directory, response['X-Profile'] + '.txt')) as summary_file:
+                self.assertIn('Ordered by: cumulative time', summary_file.read())
+
+            names = {self.client.get(reverse('teams_list_url'), HTTP_X_PROFILE='')['X-Profile'] for _ in range(2)}
+            self.assertEqual(len(names), 2)
+            self.assertEqual(len(os.listdir(directory)), 8)
+
+    def test_profile_request_write_error(self):
+        with tempfile.NamedTemporaryFile() as not_a_directory, override_settings(PROFILE_DIR=not_a_directory.name), \
+                self.assertLogs('ProjectManagerApp.profiler', 'WARNING'):
+            self.client.login(username="teacher_username", password="teacher_password")
+
+            response = self.client.get(reverse('projects_list_url'), {'profile': 'tottime'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile'))
+
+    def test_profile_request_view_exception(self):
+        request = RequestFactory().get(reverse('projects_list_url'), {'profile': 'tottime'})
+        request.user = Teacher.objects.get(username="teacher_username")
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            RequestProfilerMiddleware.process_request(request)
+            self.assertIsNotNone(sys.getprofile())
+
+            RequestProfilerMiddleware.process_exception(request, ValueError())
+
+            self.assertIsNone(sys.getprofile())
+            self.assertFalse(hasattr(request, '_profile'))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_profile_request_as_student(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            self.client.login(username="student_username", password="student_password")
+
+            response = self.client.get(reverse('projects_list_url'), {'profile': 'tottime'})
+
+            self.assertFalse(response.has_header('X-Profile'))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_profile_request_disabled(self):
+        self.client.login(username="teacher_username", password="teacher_password")
+
+        response = self.client.get(reverse('projects_list_url'), {'profile': 'tottime'})
+
+        self.assertFalse(response.has_header('X-Profile'))
+
+    def test_slow_query_log(self):
+        account_create_student(2222, "student2_username", "student2@mail.com", "student2_password")
+        student = Student.objects.get(username="student_username")
+        student2 = Student.objects.get(username="student2_username")
+        team = user_create_team(student, "test_team")
+        user_join_team(student2, team)
+        project = Project.objects.get(name="test_project0")
+        self.client.login(username="student_username", password="student_password")
+        reset_slow_query_buffer()
+
+        with override_settings(SLOW_QUERY_THRESHOLD=0), \
+                self.assertLogs('ProjectManagerApp.slow_queries', 'WARNING') as logs:
+            self.client.post(reverse('project_join_url'), {'project_id': project.id})
+
+        queries = get_slow_query_buffer().get_queries()
+        self.assertEqual(len(logs.records), len(queries))
+        join_queries = [query for query in queries if query.caller == 'user_team_join_project']
+        self.assertTrue(join_queries)
+        self.assertTrue(all(query.view == 'project_join' for query in join_queries))
+        self.assertTrue(all(query.plan for query in join_queries if query.sql.startswith('SELECT')))
+
+    def make_superuser(self):
+        Teacher.objects.filter(username="teacher_username").update(is_superuser=True)
+
+    def test_slow_queries_view(self):
+        self.make_superuser()
+        self.client.login(username="teacher_username", password="teacher_password")
+        reset_slow_query_buffer()
+
+        with override_settings(SLOW_QUERY_THRESHOLD=0), self.assertLogs('ProjectManagerApp.slow_queries', 'WARNING'):
+            self.client.get(reverse('projects_list_url'))
+            response = self.client.get(reverse('slow_queries_url'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ProjectListView.get', [query.view for query in response.context['slow_queries']])
+        self.assertContains(response, 'View: ProjectListView.get')
+
+    def test_slow_queries_view_hides_params(self):
+        self.make_superuser()
+        self.client.login(username="teacher_username", password="teacher_password")
+        reset_slow_query_buffer()
+        student = Student.objects.get(username="student_username")
+
+        with override_settings(SLOW_QUERY_THRESHOLD=0), \
+                self.assertLogs('ProjectManagerApp.slow_queries', 'WARNING') as logs:
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE auth_user SET password = %s WHERE id = %s', ['secret_password_hash', student.pk])
+            response = self.client.get(reverse('slow_queries_url'))
+
+        self.assertContains(response, 'UPDATE auth_user SET password = %s WHERE id = %s')
+        self.assertContains(response, "Params: [&#39;str&#39;, &#39;int&#39;]")
+        self.assertNotContains(response, 'secret_password_hash')
+        self.assertFalse(any('secret_password_hash' in record.getMessage() for record in logs.records))
+
+    def test_slow_queries_view_as_staff(self):
+        self.client.login(username="teacher_username", password="teacher_password")
+
+        response = self.client.get(reverse('slow_queries_url'))
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_slow_queries_view_as_student(self):
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('slow_queries_url'))
+
+        self.assertEqual(response.status_code, 302)
+
+    def read_trace_file(self, path):
+        with open(path) as trace_file:
+            return [json.loads(line) for line in trace_file]
+
+    def test_service_spans_nested_under_request_span(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            self.client.login(username="student_username", password="student_password")
+
+            with override_settings(SERVICE_TRACE_FILE=path):
+                self.client.post(reverse('team_create_url'), {'name': 'test_team'})
+
+            spans = self.read_trace_file(path)
+
+        request_span = spans[0]
+        self.assertEqual(request_span['name'], 'team_create_url')
+        self.assertEqual(request_span['kind'], 'request')
+        self.assertIsNone(request_span['parent_id'])
+        self.assertEqual(request_span['method'], 'POST')
+        self.assertEqual(request_span['status'], 302)
+
+        spans = {span['name']: span for span in spans}
+        self.assertEqual(spans['user_create_team']['parent_id'], request_span['span_id'])
+        self.assertEqual(len({span['trace_id'] for span in spans.values()}), 1)
+        self.assertEqual(spans['user_create_team']['rows_written'], 2)
+        self.assertGreater(spans['user_create_team']['queries'], 0)
+        self.assertGreaterEqual(request_span['queries'], spans['user_create_team']['queries'])
+        self.assertIsNone(spans['user_create_team']['exception'])
+        self.assertEqual(spans['lock_student']['parent_id'], spans['user_create_team']['span_id'])
+        self.assertEqual(spans['lock_student']['queries'], 1)
+
+    def test_service_span_records_exception(self):
+        account_create_student(2222, "student2_username", "student2@mail.com", "student2_password")
+        account_create_student(3333, "student3_username", "student3@mail.com", "student3_password")
+        team = user_create_team(Student.objects.get(username="student2_username"), "test_team")
+        user_join_team(Student.objects.get(username="student3_username"), team)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            self.client.login(username="student_username", password="student_password")
+
+            with override_settings(SERVICE_TRACE_FILE=path):
+                self.client.post(reverse('team_join_url'), {'team_id': team.id})
+
+            spans = {span['name']: span for span in self.read_trace_file(path)}
+
+        self.assertEqual(spans['user_join_team']['exception'], 'TeamIsFull')
+        self.assertEqual(spans['user_join_team']['rows_written'], 0)
+        self.assertIsNone(spans['team_join_url']['exception'])
+
+    def test_service_traced_outside_of_request(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+
+            with override_settings(SERVICE_TRACE_FILE=path), \
+                    self.assertRaises(UserWithGivenUsernameAlreadyExists):
+                account_create_student(2222, "student_username", "student2@mail.com", "student2_password")
+
+            spans = {span['name']: span for span in self.read_trace_file(path)}
+
+        self.assertEqual(spans['account_create_student']['kind'], 'service')
+        self.assertEqual(spans['account_create_student']['exception'], 'UserWithGivenUsernameAlreadyExists')
+        self.assertIsNone(spans['account_create_student']['parent_id'])
+        self.assertEqual(list(spans), ['account_create_student'])
+        self.assertIsNone(get_current_trace())
+
+    def test_metrics_endpoint(self):
+        self.client.login(username="teacher_username", password="teacher_password")
+        self.client.get(reverse('projects_list_url'))
+
+        response = self.client.get(reverse('metrics_url'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn('# TYPE projectmanager_request_duration_seconds histogram', content)
+        self.assertIn('projectmanager_request_duration_seconds_bucket{view="projects_list_url",le="+Inf"} 1', content)
+        self.assertIn('projectmanager_request_duration_seconds_count{view="projects_list_url"} 1', content)
+        self.assertIn('projectmanager_request_sql_queries_count{view="projects_list_url"} 1', content)
+
+    def test_metrics_endpoint_as_student(self):
+        self.client.login(username="student_username", password="student_password")
+
+        response = self.client.get(reverse('metrics_url'))
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_metrics_merged_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory,
+                                                                           METRICS_FLUSH_INTERVAL=0):
+            self.client.login(username="student_username", password="student_password")
+            self.client.get(reverse('projects_list_url'))
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+            other_process = MetricsRegistry()
+            other_process.record_request('projects_list_url', SlowRequestTrace())
+            other_process.flush(directory)
+
+            metrics = collect_metrics()
+
+        self.assertEqual(sum(metrics['histograms']['projectmanager_request_duration_seconds']['projects_list_url']
+                             ['buckets']), 2)
+        self.assertEqual(metrics['histograms']['projectmanager_request_sql_queries']['projects_list_url']['buckets'][-1],
+                         1)
+
+    def test_metrics_files_of_exited_processes_pruned(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            files = {}
+            for label, pid, age in (('exited stale', exited.pid, 7200), ('exited recent', exited.pid, 0),
+                                    ('running stale', os.getpid(), 7200)):
+                registry = MetricsRegistry()
+                registry.file_name = repr(pid) + registry.file_name[registry.file_name.index('-'):]
+                registry.record_request('projects_list_url', SlowRequestTrace())
+                registry.flush(directory)
+                modified = time.time() - age
+                os.utime(os.path.join(directory, registry.file_name), (modified, modified))
+                files[registry.file_name] = label
+
+            metrics = collect_metrics()
+
+            self.assertEqual(sorted(files[name] for name in os.listdir(directory)), ['exited recent', 'running stale'])
+        self.assertEqual(sum(metrics['histograms']['projectmanager_request_duration_seconds']['projects_list_url']
+                             ['buckets']), 2)
+
+
+class SlowRequestTrace(object):
+    duration = 20.0
+    sql_count = 5000
+    sql_time = 15.0
+    template_time = 1.0
+
 
 # FORMS TESTS
 
@@ -18,14 +18,18 @@ urlpatterns = [
     url(r'^projects/create/$', ProjectCreateFormView.as_view(), name="project_create_url"),
     url(r'^projects/join/$', views.project_join, name="project_join_url"),
     url(r'^projects/leave/$', views.project_leave, name="project_leave_url"),
+    url(r'^projects/preferences/$', views.ProjectPreferencesFormView.as_view(), name="project_preferences_url"),
     url(r'^projects/delete/$', views.project_delete, name="project_delete_url"),
     url(r'^projects/details/(?P<id>[0-9]+)/$', views.ProjectDetailsView.as_view(), name="project_details_url"),
     url(r'^projects/edit/(?P<id>[0-9]+)/$', views.ProjectEditFormView.as_view(), name="project_edit_url"),
     url(r'^teams/$', TeamListView.as_view(), name="teams_list_url"),
     url(r'^teams/create/$', TeamCreateFormView.as_view(), name="team_create_url"),
     url(r'^teams/assign/$', views.team_assign, name="team_assign_url"),
+    url(r'^teams/assign/preview/$', views.TeamAssignPreviewView.as_view(), name="team_assign_preview_url"),
     url(r'^teams/join/$', views.team_join, name="team_join_url"),
     url(r'^teams/leave/$', views.team_leave, name="team_leave_url"),
     url(r'^teams/details/(?P<id>[0-9]+)/$', views.TeamDetailsView.as_view(), name="team_details_url"),
+    url(r'^metrics/$', views.metrics, name='metrics_url'),
+    url(r'^metrics/slowQueries/$', views.SlowQueriesView.as_view(), name='slow_queries_url'),
     url(r'^.*/$', views.handler404, name='error_404_url'),
 ]
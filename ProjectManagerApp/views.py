@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate as auth_authenticate, login as auth_login, logout as auth_logout, \
     update_session_auth_hash
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.urlresolvers import reverse
+from django.db.models import Count
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_POST
@@ -12,14 +15,19 @@ from django.views.generic import TemplateView
 from ProjectManagerApp.exceptions import UserAlreadyInTeam, UserNotInTeam, \
     ProjectHasAssignedTeam, UserWithGivenUsernameAlreadyExists, StudentWithGivenStudentNoAlreadyExists, \
     TeamAlreadyInProjectQueue, TeamNotInProjectQueue, UserWithGivenEmailAlreadyExists, InvalidPassword, \
-    TeamIsFull, UserAssignedToProject, TeamWithGivenNameAlreadyExists, ProjectWithGivenNameAlreadyExists, MustBeAuthor
+    TeamIsFull, UserAssignedToProject, TeamWithGivenNameAlreadyExists, ProjectWithGivenNameAlreadyExists, MustBeAuthor, \
+    TooManyProjectPreferences, DuplicateProjectPreference
 from ProjectManagerApp.forms import LoginForm, AccountCreateForm, ProjectCreateForm, TeamCreateForm, \
-    AccountChangeEmailForm, AccountChangePasswordForm, ProjectEditForm
-from ProjectManagerApp.models import Project, Team, Student, Teacher
+    AccountChangeEmailForm, AccountChangePasswordForm, ProjectEditForm, ProjectPreferencesForm
+from ProjectManagerApp.models import Project, Team, Student, Teacher, TeamProjectPreference
 from ProjectManagerApp.services import user_join_team, user_create_team, user_team_leave, user_delete_project, \
     user_create_project, user_team_join_project, account_create_teacher, account_create_student, \
     user_team_leave_project, user_change_email, user_change_password, assign_teams_to_projects, user_delete_account, \
-    user_edit_project
+    user_edit_project, assign_teams_to_projects_by_preferences, user_team_set_project_preferences
+from ProjectManagerApp.service.KeysetPaginator import KeysetPaginator
+from ProjectManagerApp.service.RequestMetrics import collect_metrics, render_prometheus
+from ProjectManagerApp.service.SlowQueryLog import get_slow_query_buffer
+from ProjectManagerApp.service.TeamAssignment import ASSIGNMENT_MODE_LOTTERY, ASSIGNMENT_MODE_PREFERENCES
 
 
 class AccountCreateFormView(FormView):
@@ -221,14 +229,18 @@ class AccountChangePasswordFormView(FormView):
 class TeamListView(TemplateView):
     template_name = 'team/list.html'
 
-    def get_context_data(self, teams, **kwargs):
+    def get_context_data(self, page, **kwargs):
         context = super(TeamListView, self).get_context_data(**kwargs)
-        context['teams'] = teams
+        context['teams'] = page.object_list
+        context['page'] = page
         return context
 
     def get(self, request, *args, **kwargs):
-        teams = Team.objects.all()
-        return render(request, self.template_name, self.get_context_data(teams))
+        teams = Team.objects.select_related('first_teammate', 'second_teammate') \
+            .only('name', 'first_teammate__username', 'second_teammate__username')
+        page = KeysetPaginator(teams, settings.LIST_PAGE_SIZE).page(request.GET.get('after'),
+                                                                    request.GET.get('before'))
+        return render(request, self.template_name, self.get_context_data(page))
 
 
 @method_decorator(login_required, name='dispatch')
@@ -279,6 +291,10 @@ def team_join(request):
 
     try:
         user_join_team(request.user, team)
+    except Team.DoesNotExist:
+        # The last teammate left and deleted the team in the meantime.
+        messages.add_message(request, messages.ERROR, 'Invalid team.')
+        return redirect(reverse('teams_list_url'))
     except UserAlreadyInTeam:
         messages.add_message(request, messages.ERROR, 'You already have a team. Quit your team first.')
         return redirect(reverse('teams_list_url'))
@@ -293,19 +309,77 @@ def team_join(request):
 @login_required
 @user_passes_test(lambda u: isinstance(u, Teacher))
 def team_assign(request):
-    projects_assigned = assign_teams_to_projects(request.user)
+    try:
+        seed = parse_assignment_seed(request.POST.get('seed'))
+    except ValueError:
+        messages.add_message(request, messages.ERROR, 'Invalid seed.')
+        return redirect(reverse('index_url'))
+
+    if request.POST.get('mode') == ASSIGNMENT_MODE_PREFERENCES:
+        result = assign_teams_to_projects_by_preferences(request.user)
+        ranks = ', '.join(repr(rank) + ': ' + repr(count) for rank, count in sorted(result.rank_distribution.items()))
+        messages.add_message(request, messages.INFO,
+                             'Assigning completed. Assigned teams to ' + repr(result.projects_assigned) +
+                             ' projects in ' + '%.3f' % result.solve_time + ' s.' +
+                             (' Assigned teams by preference rank: ' + ranks + '.' if ranks else ''))
+        return redirect(reverse('projects_list_url'))
+
+    result = assign_teams_to_projects(request.user, seed)
     messages.add_message(request, messages.INFO,
-                         'Assigning completed. Assigned teams to ' + repr(projects_assigned) + ' projects.')
+                         'Assigning completed. Assigned teams to ' + repr(result.projects_assigned) + ' projects.')
     return redirect(reverse('projects_list_url'))
 
 
+def parse_assignment_seed(value):
+    if not value:
+        return None
+
+    seed = int(value)
+    if seed < 0:
+        raise ValueError
+    return seed
+
+
+@method_decorator(login_required, name='dispatch')
+@method_decorator(user_passes_test(lambda u: isinstance(u, Teacher)), name='dispatch')
+class TeamAssignPreviewView(TemplateView):
+    template_name = 'team/assignPreview.html'
+
+    def get_context_data(self, result, **kwargs):
+        context = super(TeamAssignPreviewView, self).get_context_data(**kwargs)
+        projects = Project.objects.only('name').in_bulk(list(result.assignments))
+        teams = Team.objects.only('name').in_bulk([team[0] for team in result.assignments.values()])
+        context['result'] = result
+        context['rank_distribution'] = sorted(result.rank_distribution.items())
+        context['assignments'] = sorted(((projects[project_id], teams[team[0]])
+                                         for project_id, team in result.assignments.items()),
+                                        key=lambda assignment: assignment[0].name)
+        return context
+
+    def get(self, request, *args, **kwargs):
+        mode = request.GET.get('mode', ASSIGNMENT_MODE_LOTTERY)
+        try:
+            seed = parse_assignment_seed(request.GET.get('seed'))
+        except ValueError:
+            messages.add_message(request, messages.ERROR, 'Invalid seed.')
+            return redirect(reverse('index_url'))
+
+        if mode == ASSIGNMENT_MODE_PREFERENCES:
+            result = assign_teams_to_projects_by_preferences(request.user, dry_run=True)
+        else:
+            result = assign_teams_to_projects(request.user, seed, dry_run=True)
+
+        return render(request, self.template_name, self.get_context_data(result))
+
+
 @method_decorator(login_required, name='dispatch')
 class TeamDetailsView(TemplateView):
     template_name = 'team/details.html'
 
     def get(self, request, *args, **kwargs):
         try:
-            team = Team.objects.get(pk=self.kwargs['id'])
+            team = Team.objects.select_related('first_teammate', 'second_teammate', 'project') \
+                .get(pk=self.kwargs['id'])
         except (KeyError, Team.DoesNotExist):
             messages.add_message(request, messages.ERROR, 'Invalid team.')
             return redirect(reverse('teams_list_url'))
@@ -334,14 +408,20 @@ def team_leave(request):
 class ProjectListView(TemplateView):
     template_name = 'project/list.html'
 
-    def get_context_data(self, projects, **kwargs):
+    def get_context_data(self, page, **kwargs):
         context = super(ProjectListView, self).get_context_data(**kwargs)
-        context['projects'] = projects
+        context['projects'] = page.object_list
+        context['page'] = page
         return context
 
     def get(self, request, *args, **kwargs):
-        projects = Project.objects.all()
-        return render(request, self.template_name, self.get_context_data(projects))
+        projects = Project.objects.defer('description') \
+            .select_related('assigned_team', 'author') \
+            .prefetch_related('all_teams') \
+            .annotate(waiting_teams_count=Count('all_teams'))
+        page = KeysetPaginator(projects, settings.LIST_PAGE_SIZE).page(request.GET.get('after'),
+                                                                       request.GET.get('before'))
+        return render(request, self.template_name, self.get_context_data(page))
 
 
 @method_decorator(login_required, name='dispatch')
@@ -424,6 +504,55 @@ class ProjectEditFormView(FormView):
         return render(request, self.template_name, self.create_context_data(project_edit_form, project_id))
 
 
+@method_decorator(login_required, name='dispatch')
+@method_decorator(user_passes_test(lambda u: isinstance(u, Student)), name='dispatch')
+class ProjectPreferencesFormView(FormView):
+    template_name = 'project/preferences.html'
+    form_class = ProjectPreferencesForm
+
+    def get_context_data(self, **kwargs):
+        return self.create_context_data(self.create_form(initial=self.get_initial_preferences()))
+
+    def create_context_data(self, project_preferences_form, **kwargs):
+        context = super(ProjectPreferencesFormView, self).get_context_data(**kwargs)
+        context['project_preferences_form'] = project_preferences_form
+        return context
+
+    def get_form(self, form_class=None):
+        return self.create_form(**self.get_form_kwargs())
+
+    def create_form(self, *args, **kwargs):
+        projects = Project.objects.filter(assigned_team__isnull=True).only('name').order_by('name')
+        return ProjectPreferencesForm(projects, settings.PROJECT_PREFERENCES_MAX, *args, **kwargs)
+
+    def get_initial_preferences(self):
+        preferences = TeamProjectPreference.objects.filter(team_id=self.request.user.team_id)
+        return {'rank_' + repr(rank): project_id for rank, project_id in preferences.values_list('rank', 'project_id')}
+
+    def get(self, request, *args, **kwargs):
+        return render(request, self.template_name, self.get_context_data())
+
+    def post(self, request, *args, **kwargs):
+        project_preferences_form = self.create_form(request.POST)
+        if project_preferences_form.is_valid():
+            try:
+                user_team_set_project_preferences(request.user, project_preferences_form.get_projects())
+            except UserNotInTeam:
+                messages.add_message(request, messages.ERROR, 'You have no team. Join or create your own team first.')
+                return redirect(reverse('projects_list_url'))
+            except UserAssignedToProject:
+                messages.add_message(request, messages.ERROR, 'Your team is already assigned to a project.')
+                return redirect(reverse('projects_list_url'))
+            except (TooManyProjectPreferences, DuplicateProjectPreference, ProjectHasAssignedTeam):
+                messages.add_message(request, messages.ERROR, 'Invalid project preferences.')
+                return render(request, self.template_name, self.create_context_data(project_preferences_form))
+
+            messages.add_message(request, messages.SUCCESS, 'Project preferences saved.')
+            return redirect(reverse('projects_list_url'))
+
+        return render(request, self.template_name, self.create_context_data(project_preferences_form))
+
+
 @require_POST
 @login_required
 @user_passes_test(lambda u: isinstance(u, Student))
@@ -511,5 +640,26 @@ def project_delete(request):
     return redirect(reverse('projects_list_url'))
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def metrics(request):
+    return HttpResponse(render_prometheus(collect_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@method_decorator(login_required, name='dispatch')
+@method_decorator(user_passes_test(lambda u: u.is_superuser), name='dispatch')
+class SlowQueriesView(TemplateView):
+    template_name = 'slowQueries.html'
+
+    def get_context_data(self, **kwargs):
+        context = super(SlowQueriesView, self).get_context_data(**kwargs)
+        context['slow_queries'] = get_slow_query_buffer().get_queries()
+        context['slow_query_threshold'] = settings.SLOW_QUERY_THRESHOLD
+        return context
+
+    def get(self, request, *args, **kwargs):
+        return render(request, self.template_name, self.get_context_data())
+
+
 def handler404(request):
     return render(request, 'http_error.html', {'error_code': 404, 'error_message': 'Page not found'}, status=404)